@@ -16,8 +16,13 @@ from src import format as fmt
 from src.ConsoleMultiplex import ConsoleMultiplex
 from src.config import gopts
 from src.generate import generate_build_scripts
-from src.build_utils import process_project, show_statistics, process_toolchains
-from src.git_utils import git_fetch_project
+from src.build_utils import process_projects, show_statistics, process_toolchains
+from src.git_utils import git_fetch_projects
+from src.remote_refs import RemoteRefCache
+from src.history import show_stats_history
+from src.build_log import show_logs
+from src.events import EventLog
+from src.trace import write_trace
 # Src modules (refactored)
 from src.args import parse_args
 from src.config_loader import import_toolchains, import_projects
@@ -117,6 +122,18 @@ def main():
         fmt.h(f"  project actions: {p_verbs}")
         fmt.h(f"  build actions: [{b_verbs}]")
 
+    if gopts.stats_history:
+        with fmt.Section("Stats History"):
+            show_stats_history( gopts )
+        console.pop( "build_log" )
+        return
+
+    if 'logs' in gopts.actions:
+        with fmt.Section("Build Logs"):
+            show_logs( gopts )
+        console.pop( "build_log" )
+        return
+
     # TODO if help in any of the system verbs then display a list of verb help items.
     # List only.
     if gopts.list:
@@ -154,6 +171,9 @@ def main():
         else:
             process_toolchains( gopts )
 
+    # Fetches, script generation and builds are recorded for the run's timeline.
+    events = EventLog( gopts.path / 'events.jsonl' )
+
     # Basically the same thing again for the fetch command in prject, should be re-arranged
     with fmt.Section("Process Project Actions"):
         if len(gopts.project_actions) == 0:
@@ -162,8 +182,7 @@ def main():
         else:
             if 'fetch' in gopts.project_actions:
                 with fmt.Section( 'Fetching Projects' ):
-                    for project in projects.values():
-                        git_fetch_project( gopts, project )
+                    git_fetch_projects( gopts, projects, RemoteRefCache( gopts ), events )
 
     # Generate the build scripts
     # This one is the processing script for the build itself, should be renamed.something like
@@ -173,17 +192,21 @@ def main():
             verbs = ', '.join(gopts.build_verbs) if gopts.build_verbs else 'none'
             fmt.h(f"No build actions specified. Available: [{verbs}]")
         else:
-            with fmt.Section("Generate Build Scripts"):
+            with fmt.Section("Generate Build Scripts"), events.span( 'generate' ):
                 generate_build_scripts( gopts )
 
-            for project in projects.values():
-                try: process_project( gopts, project )
-                except KeyboardInterrupt:
-                    print("Processing Cancelled")
+            try: process_projects( gopts, projects, events )
+            except KeyboardInterrupt:
+                print("Processing Cancelled")
+    events.close()
 
     with fmt.Section("Show Statistics"):
         show_statistics( gopts )
 
+    if gopts.trace:
+        write_trace( events.path, gopts.path / 'trace.json' )
+        fmt.h( f"Trace written to {gopts.path / 'trace.json'}" )
+
     console.pop( "build_log" )
 
 if __name__ == "__main__":
@@ -1,11 +1,11 @@
-import copy
 from types import SimpleNamespace
 
 from rich import json
 from rich.pretty import pprint
 
 from src.config import git_base
-from src.expand_config import expand_attr_list, short_host, expand_cmake
+from src.expand_config import expand_attr_list, short_host, expand_cmake, prune_by_name
+from src.layer import ConfigLayer
 import src.format as fmt
 
 # MARK: Generate
@@ -75,6 +75,14 @@ def generate( opts:SimpleNamespace ) -> SimpleNamespace:
         opts.toolchains.values() )
     fmt.hu(f"build configs after toolchain expansion: {len(builds)}")
 
+    # Drop toolchains that can't produce a name matching --build-regex before the fan-out.
+    cmake = project.buildtools['cmake']
+    builds = prune_by_name( builds, build_name,
+        target=['editor', 'template_debug', 'template_release'],
+        bt_name=['scons'] + [f'cmake-{t}-{g}' for t in cmake.config_types for g in cmake.generators],
+        variant=variations.keys() )
+    fmt.hu(f"build configs matching --build-regex: {len(builds)}")
+
     # godot targets
     builds:list[SimpleNamespace] = expand_func(
         builds,
@@ -103,26 +111,7 @@ def generate( opts:SimpleNamespace ) -> SimpleNamespace:
 
     # == name the build ==
     for build in builds:
-        tc = build.toolchain
-        bt = build.buildtool
-
-        bt_name = bt.name
-        if bt_name == 'cmake':
-            bt_name = f'{bt.name}-{bt.short_type}-{bt.short_gen}'
-
-        name_parts = [
-            short_host(),
-            bt_name,
-            tc.name,
-            tc.target_arch if tc.target_platform not in ['emscripten'] else None,
-            godot_platforms[tc.target_platform] if tc.target_platform not in ['android', 'emscripten'] else None,
-            build.target,
-            build.variant if build.variant != 'default' else None,
-            # build.source_def.remote if build.source_def.remote != 'origin' else None,
-            # build.source_def.ref
-        ]
-
-        build.name = '.'.join(filter(None, name_parts))
+        build.name = build_name( build )
         build.source_dir =  build.name
 
         build.script_parts += [show_stats]
@@ -131,6 +120,32 @@ def generate( opts:SimpleNamespace ) -> SimpleNamespace:
     return project
 
 
+def build_name( build:SimpleNamespace, bt_name:str|None = None, target:str|None = None, variant:str|None = None ) -> str:
+    """The build name, the keyword arguments stand in for parts the build doesn't have yet."""
+    from godot.config import godot_platforms
+    tc = build.toolchain
+
+    if bt_name is None:
+        bt = build.buildtool
+        bt_name = bt.name
+        if bt_name == 'cmake':
+            bt_name = f'{bt.name}-{bt.short_type}-{bt.short_gen}'
+
+    variant = variant or build.variant
+    name_parts = [
+        short_host(),
+        bt_name,
+        tc.name,
+        tc.target_arch if tc.target_platform not in ['emscripten'] else None,
+        godot_platforms[tc.target_platform] if tc.target_platform not in ['android', 'emscripten'] else None,
+        target or build.target,
+        variant if variant != 'default' else None,
+        # build.source_def.remote if build.source_def.remote != 'origin' else None,
+        # build.source_def.ref
+    ]
+    return '.'.join(filter(None, name_parts))
+
+
 
     build_start = SimpleNamespace({**vars(build_base), **{
         'verbs': ['source'],
@@ -222,7 +237,7 @@ def generate( opts:SimpleNamespace ) -> SimpleNamespace:
 # │ |___/\__\___/_||_/__/                                                      │
 # ╰────────────────────────────────────────────────────────────────────────────╯
 def expand_scons( build:SimpleNamespace ) -> list[SimpleNamespace]:
-    new_build = copy.deepcopy(build)
+    new_build = ConfigLayer(build)
     return [new_build]
 
 def configure_scons( build:SimpleNamespace ) -> bool:
@@ -254,7 +269,7 @@ def expand_variations( config:SimpleNamespace ) -> list:
     """
     configs_out:list = []
     for label, config_func in variations.items():
-        cfg = copy.deepcopy(config)
+        cfg = ConfigLayer(config)
 
         setattr(cfg, 'variant', label)
 
@@ -1,10 +1,9 @@
-import copy
-from copy import deepcopy
 from types import SimpleNamespace
 
 import src.expand_config
 from src.config import godot_platforms, godot_arch
-from src.expand_config import expand_toolchains, expand_buildtools, short_host, expand_func, expand_attr_list
+from src.expand_config import expand_toolchains, expand_buildtools, short_host, expand_func, expand_attr_list, prune_by_name
+from src.layer import ConfigLayer
 from share.script_preamble import *
 
 
@@ -80,6 +79,12 @@ def generate( opts:SimpleNamespace ) -> SimpleNamespace:
     builds = expand_func( builds, expand_toolchains, project )
     builds = expand_func( builds, configure_toolchain )
 
+    # Drop toolchains that can't produce a name matching --build-regex before the fan-out.
+    cmake = project.buildtools['cmake']
+    builds = prune_by_name( builds, build_name,
+        bt_parts=[('scons',)] + [('cmake', t, g) for t in cmake.config_types for g in cmake.generators],
+        target=['template_release', 'template_debug', 'editor'] )
+
     builds = expand_func( builds, expand_buildtools, project )
 
     # target and variants
@@ -89,46 +94,35 @@ def generate( opts:SimpleNamespace ) -> SimpleNamespace:
     for build in builds:
 
         buildtool = build.buildtool
-        toolchain = build.toolchain
 
         srcdir_parts = [
             short_host(),
             buildtool.name,
         ]
 
-        name_parts = [
-            toolchain.name,
-            build.arch if build.platform not in ['emscripten'] else None,
-            build.platform if build.platform not in ['android', 'emscripten'] else None,
-            build.godotcpp_target
-        #     build.variant if build.variant != 'default' else None,
-        ]
-        src_name = build.source_def.name
-        if src_name != 'origin':
-            ref = build.source_def.ref
-            suffix = ref[:8] if len(ref) >= 8 else ref
-            name_parts.append(suffix)
+        build.name = build_name(build)
+        suffix = source_suffix(build)
 
         if buildtool.name == 'scons':
-            build.name = '.'.join(filter(None,srcdir_parts+name_parts))
             build.source_dir =  build.name
 
         elif buildtool.name == 'cmake':
-            cmake = build.buildtool
-
-            name_parts += [
-                cmake.short_type,
-                cmake.short_gen,
-            ]
-
-            builddir_parts = ['build'] + name_parts
-
-            build.name = '.'.join(filter(None,srcdir_parts+name_parts))
-            source_dir_parts = srcdir_parts[:]
-            if src_name != 'origin':
-                source_dir_parts.append(suffix)
-            build.source_dir = '.'.join(filter(None, source_dir_parts))
-            build.buildtool.build_dir = '.'.join(filter(None,builddir_parts))
+            build.source_dir = '.'.join(filter(None, srcdir_parts + [suffix]))
+            # the build name without the host and buildtool
+            build.buildtool.build_dir = '.'.join(['build', *build.name.split('.')[2:]])
+
+        # Artifacts, the static library we build and the godot executables test_script runs.
+        platform = godot_platforms[build.platform]
+        arch = godot_arch[build.arch]
+        lib_dir = f'{build.buildtool.build_dir}/bin' if buildtool.name == 'cmake' else 'bin'
+        build.produces = {
+            f'godot-cpp.{platform}.{build.godotcpp_target}.{arch}':
+                f'{lib_dir}/libgodot-cpp.{platform}.{build.godotcpp_target}*.{arch}*',
+        }
+        # Only waited on once the test verb below is enabled again.
+        build.consumes = {
+            'test': [f'godot.{platform}.editor.{arch}', f'godot.{platform}.template_release.{arch}'],
+        }
 
         # build.verbs += ['test']
         # build.script_parts += [test_script, show_stats]
@@ -137,6 +131,34 @@ def generate( opts:SimpleNamespace ) -> SimpleNamespace:
     project.build_configs = {v.name: v for v in builds }
     return project
 
+
+def source_suffix( build:SimpleNamespace ) -> str|None:
+    """The start of the ref of builds from a source other than origin, None for origin."""
+    if build.source_def.name == 'origin': return None
+    return build.source_def.ref[:8]
+
+
+def build_name( build:SimpleNamespace, bt_parts:tuple|None = None, target:str|None = None ) -> str:
+    """The build name, the keyword arguments stand in for parts the build doesn't have yet.
+
+    ``bt_parts`` is the buildtool's name, followed for cmake by its short config type and generator.
+    """
+    if bt_parts is None:
+        bt = build.buildtool
+        bt_parts = (bt.name, bt.short_type, bt.short_gen) if bt.name == 'cmake' else (bt.name,)
+
+    name_parts = [
+        short_host(),
+        bt_parts[0],
+        build.toolchain.name,
+        build.arch if build.platform not in ['emscripten'] else None,
+        build.platform if build.platform not in ['android', 'emscripten'] else None,
+        target or build.godotcpp_target,
+        source_suffix(build),
+        *bt_parts[1:],
+    ]
+    return '.'.join(filter(None, name_parts))
+
 # MARK: Scripts
 # ╓────────────────────────────────────────────────────────────────────────────╖
 # ║            ███████  ██████ ██████  ██ ██████  ████████ ███████             ║
@@ -628,7 +650,7 @@ def expand_scons( config:SimpleNamespace ) -> list[SimpleNamespace]:
     platform = godot_platforms[config.platform]
     arch = godot_arch[config.arch]
 
-    config.buildtool = deepcopy(config.buildtool)
+    config.buildtool = ConfigLayer(config.buildtool)
     scons = config.buildtool
     scons.build_dir = 'test'
     scons.build_vars += [
@@ -667,7 +689,7 @@ def expand_scons( config:SimpleNamespace ) -> list[SimpleNamespace]:
     # Split the compile up into individual targets
     configs_out = []
     for target in ["template_release", "template_debug", "editor"]:
-        cfg = copy.deepcopy(config)
+        cfg = ConfigLayer(config)
         setattr(cfg, 'godotcpp_target', target)
 
         scons = cfg.buildtool
@@ -688,7 +710,7 @@ def expand_scons( config:SimpleNamespace ) -> list[SimpleNamespace]:
 def expand_cmake_target( config:SimpleNamespace ) -> list[SimpleNamespace]:
     configs_out = []
     for target in ["template_release", "template_debug", "editor"]:
-        cfg = copy.deepcopy(config)
+        cfg = ConfigLayer(config)
         setattr(cfg, 'godotcpp_target', target)
         cmake = cfg.buildtool
         cmake.config_vars.append(f'-DGODOTCPP_TARGET={target}')
@@ -798,7 +820,7 @@ def expand_variant( config:SimpleNamespace ) -> list:
     }
 
     for variant, configure_func in variations.items():
-        cfg = copy.deepcopy(config)
+        cfg = ConfigLayer(config)
         setattr( cfg, 'variant', variant )
 
         if not configure_func( cfg ): # Skip variants who's configuration step fails.
@@ -2,11 +2,11 @@
 Configuration settings and build definitions for the Godot project.
 """
 
-import copy
 import pathlib
 
 from src.config import gopts, project_base, git_base, scons_base, godot_platforms, godot_arch
-from src.expand_config import expand_func, short_host, expand_attr_list
+from src.expand_config import expand_func, short_host, expand_attr_list, prune_by_name
+from src.layer import ConfigLayer
 from share.script_preamble import *
 
 # MARK: Notes
@@ -102,6 +102,9 @@ def generate( opts:SimpleNamespace ) -> SimpleNamespace:
         'toolchain',
         gopts.toolchains.values() )
 
+    # Drop toolchains that can't produce a name matching --build-regex before the fan-out.
+    builds = prune_by_name( builds, build_name, target=targets, variant=variations.keys() )
+
     # Expand build tools
     builds:list[SimpleNamespace] = expand_func(
         builds,
@@ -119,31 +122,43 @@ def generate( opts:SimpleNamespace ) -> SimpleNamespace:
 
     # Naming up to now.
     for build in builds:
-
-        # buildtool = build.buildtool
         tc = build.toolchain
 
-        name_parts = [
-            short_host(),
-            # buildtool.name, this is always "scons" for godot.
-            tc.name,
-            tc.target_arch if tc.target_platform not in ['emscripten'] else None,
-            godot_platforms[tc.target_platform] if tc.target_platform not in ['android', 'emscripten'] else None,
-            build.target,
-            build.variant,
-            # build.source_def.remote if build.source_def.remote != 'origin' else None,
-            # build.source_def.ref
-        ]
-
-        build.name = '.'.join(filter(None, name_parts))
+        build.name = build_name( build )
         build.source_dir =  build.name
 
+        # Declare the executable so downstream builds (godot-cpp tests) can wait on it.
+        platform = godot_platforms[tc.target_platform]
+        arch = godot_arch[tc.target_arch]
+        artifact = '.'.join(filter(None, ['godot', platform, build.target, arch,
+                                          build.variant if build.variant != 'default' else None]))
+        build.produces = { artifact: f'bin/godot.{platform}.{build.target}*.{arch}*' }
+
         build.script_parts += [show_stats]
 
     project.build_configs = { v.name:v for v in builds }
     return project
 
 
+def build_name( build:SimpleNamespace, target:str|None = None, variant:str|None = None ) -> str:
+    """The build name, the keyword arguments stand in for parts the build doesn't have yet."""
+    # buildtool = build.buildtool
+    tc = build.toolchain
+
+    name_parts = [
+        short_host(),
+        # buildtool.name, this is always "scons" for godot.
+        tc.name,
+        tc.target_arch if tc.target_platform not in ['emscripten'] else None,
+        godot_platforms[tc.target_platform] if tc.target_platform not in ['android', 'emscripten'] else None,
+        target or build.target,
+        variant or build.variant,
+        # build.source_def.remote if build.source_def.remote != 'origin' else None,
+        # build.source_def.ref
+    ]
+    return '.'.join(filter(None, name_parts))
+
+
 # MARK: Scripts
 # ╓────────────────────────────────────────────────────────────────────────────────────────╖
 # ║                 ███████  ██████ ██████  ██ ██████  ████████ ███████                    ║
@@ -353,6 +368,8 @@ def configure_toolchain(config:SimpleNamespace) -> list[SimpleNamespace]:
 # │ \__ \/ _/ _ \ ' \(_-<                                                      │
 # │ |___/\__\___/_||_/__/                                                      │
 # ╰────────────────────────────────────────────────────────────────────────────╯
+targets = ["template_release", "template_debug", "editor"]
+
 def expand_scons( config:SimpleNamespace ) -> list[SimpleNamespace]:
     """
     Expand SCons configuration into multiple targets.
@@ -361,8 +378,8 @@ def expand_scons( config:SimpleNamespace ) -> list[SimpleNamespace]:
     """
     # Split the compile up into individual targets
     configs_out = []
-    for target in ["template_release", "template_debug", "editor"]:
-        cfg = copy.deepcopy(config)
+    for target in targets:
+        cfg = ConfigLayer(config)
         setattr(cfg, 'target', target)
 
         scons = cfg.buildtool
@@ -640,7 +657,7 @@ def expand_variations( config:SimpleNamespace ) -> list:
     """
     configs_out:list = []
     for label, config_func in variations.items():
-        cfg = copy.deepcopy(config)
+        cfg = ConfigLayer(config)
 
         setattr(cfg, 'variant', label)
 
@@ -70,6 +70,7 @@ def generate( opts:SimpleNamespace ) -> SimpleNamespace:
 # ╙────────────────────────────────────────────────────────────────────────────────────────╜
 
 def post_checkout():
+    opts:dict = {}
     build:dict = {}
     # start_script
 
@@ -81,7 +82,10 @@ def post_checkout():
         worktree_path = build['source_path']
         os.chdir( worktree_path )
         orchestrator = git.Repo( worktree_path )
-        orchestrator.git.submodule('update', '--init', '--recursive' )
+        # godot-cpp is fetched as a project too, so new submodules borrow its objects from the store.
+        store = opts.get('object_store')
+        reference = ['--reference', Path(store).as_posix()] if store and Path(store).exists() else []
+        orchestrator.git.submodule('update', '--init', '--recursive', *reference )
 
         # engine = git.Repo( worktree_path / 'extern' / 'godot-engine'  )
         # print( Panel( engine.git.log( '-1'),  expand=False, title='godot-engine', title_align='left', width=120 ))
@@ -9,7 +9,6 @@ console = rich.console.Console()
 # │ | (_ | |  _| | (__| ' \/ -_) _| / / _ \ || |  _|                           │
 # │  \___|_|\__|  \___|_||_\___\__|_\_\___/\_,_|\__|                           │
 # ╰────────────────────────────────────────────────────────────────────────────╯
-# TODO, if the work tree is already upto date, then skip
 # TODO Rename source_git to something like checkout, and replace all verbs
 def source_git():
     config:dict = {}
@@ -25,6 +24,7 @@ def source_git():
     from rich.panel import Panel
     from rich.padding import Padding as rPadding
     from src.error import handle_error
+    from src.git_utils import RefIndex, read_ref
     import pathlib
 
     if config['ok'] and 'source' in opts['build_actions']:
@@ -42,84 +42,87 @@ def source_git():
                 build.source_dir += f".{short}"
             build.source_path = project.path / build.source_dir
 
-        # Verify we have cloned the repo.
-        gitdir = Path(srcdef.get('gitdir', 'git'))
-        if not gitdir.exists():
-            fnf = FileNotFoundError()
-            fnf.add_note(f'Missing bare git repo path: {gitdir}, project needs to be fetched')
-            # TODO Fallback to remote repo
-            raise fnf
-
-        repo = git.Repo(gitdir)
-        fmt.h(f'git-dir: {gitdir.as_posix()}')
-
-        # Prefer remote-tracking names (refs/remotes/<remote>/<ref>). Origin
-        # bare clones may only have refs/heads/<ref> until the first fetch.
-        pattern = srcdef.get('resolved_commit')
-        if not pattern:
-            remote = srcdef['remote']
-            ref = srcdef['ref']
-            candidates = [
-                f'{remote}/{ref}',
-                f'refs/remotes/{remote}/{ref}',
-            ]
-            if remote == 'origin':
-                candidates.extend([f'refs/heads/{ref}', ref])
-            pattern = candidates[0]
-            for candidate in candidates:
-                try:
-                    repo.git.rev_parse('--verify', candidate)
-                    pattern = candidate
-                    break
-                except GitCommandError:
-                    continue
-
-        bare_hash : git.RefLog
-        # FIXME, what is the point if this section?
-        try:
-            bare_hash = repo.git.log('--format=%h', '-1',  pattern)
-        except GitCommandError as e:
-            handle_error(f"git log bare pattern={pattern}", e, opts)
-
+        # The runner resolved the commit this worktree should be at, when it is
+        # there already the checkout is skipped without starting git.
         worktree_path = build['source_path']
-
-        if not worktree_path.exists():
-            # Perhaps we deleted the worktree folder, in which case prune it from the repo
-            cmd_args = [ 'prune',
-                '--verbose' if opts['verbose'] else None,
-                '--dry-run' if opts['dry'] else None ]
-            repo.git.worktree( *filter(None, cmd_args) )
-
-            fmt.h("Create WorkTree")
-            os.chdir( gitdir )
-
-            cmd_args = [ 'add', worktree_path.as_posix(), pattern ]
-            if opts['dry']:
-                fmt.hu(f'dry-run: git worktree {' '.join(filter(None, cmd_args))}')
-            else:
-                try:
-                    repo.git.worktree( *filter(None, cmd_args) )
-                except GitCommandError as e:
-                    handle_error(f"git worktree {' '.join(cmd_args)}", e, opts, critical=True)
-
-        fmt.h("WorkTree")
-        fmt.hu(f'worktree path: {worktree_path.as_posix()}')
-        worktree = git.Repo( worktree_path )
-        worktree_hash = worktree.git.log('--format=%h', '-1')
-        if bare_hash != worktree_hash:
-            fmt.hu("Updating WorkTree")
-            cmd_args = [ '--force', '--detach', pattern ]
-            if opts['dry']:
-                print(f'dry-run: git checkout {' '.join(filter(None, cmd_args))}')
-            else:
-                worktree.git.checkout( *filter(None, cmd_args) )
+        target = build.get('source_commit')
+        current = None
+        if target and worktree_path.exists():
+            try: current = read_ref( git.Repo( worktree_path ), 'HEAD' )
+            except git.exc.InvalidGitRepositoryError: pass
+        if target and current == target:
+            fmt.h(f"WorkTree is Up-to-Date: {target[:8]}")
         else:
-            fmt.hu("WorkTree is Up-to-Date")
+            # Verify we have cloned the repo.
+            gitdir = Path(srcdef.get('gitdir', 'git'))
+            if not gitdir.exists():
+                fnf = FileNotFoundError()
+                fnf.add_note(f'Missing bare git repo path: {gitdir}, project needs to be fetched')
+                # TODO Fallback to remote repo
+                raise fnf
+
+            repo = git.Repo(gitdir)
+            fmt.h(f'git-dir: {gitdir.as_posix()}')
+
+            # Prefer remote-tracking names (refs/remotes/<remote>/<ref>). Origin
+            # bare clones may only have refs/heads/<ref> until the first fetch.
+            # The candidates are looked up in one for-each-ref of the bare repo.
+            pattern = srcdef.get('resolved_commit')
+            if not pattern:
+                remote = srcdef['remote']
+                ref = srcdef['ref']
+                candidates = [
+                    f'{remote}/{ref}',
+                    f'refs/remotes/{remote}/{ref}',
+                ]
+                if remote == 'origin':
+                    candidates.extend([f'refs/heads/{ref}', ref])
+                pattern = RefIndex(repo).first(candidates) or candidates[0]
+
+            bare_hash : git.RefLog
+            # FIXME, what is the point if this section?
+            try:
+                bare_hash = repo.git.log('--format=%h', '-1',  pattern)
+            except GitCommandError as e:
+                handle_error(f"git log bare pattern={pattern}", e, opts)
+
+            if not worktree_path.exists():
+                # Perhaps we deleted the worktree folder, in which case prune it from the repo
+                cmd_args = [ 'prune',
+                    '--verbose' if opts['verbose'] else None,
+                    '--dry-run' if opts['dry'] else None ]
+                repo.git.worktree( *filter(None, cmd_args) )
+
+                fmt.h("Create WorkTree")
+                os.chdir( gitdir )
+
+                cmd_args = [ 'add', worktree_path.as_posix(), pattern ]
+                if opts['dry']:
+                    fmt.hu(f'dry-run: git worktree {' '.join(filter(None, cmd_args))}')
+                else:
+                    try:
+                        repo.git.worktree( *filter(None, cmd_args) )
+                    except GitCommandError as e:
+                        handle_error(f"git worktree {' '.join(cmd_args)}", e, opts, critical=True)
+
+            fmt.h("WorkTree")
+            fmt.hu(f'worktree path: {worktree_path.as_posix()}')
+            worktree = git.Repo( worktree_path )
+            worktree_hash = worktree.git.log('--format=%h', '-1')
+            if bare_hash != worktree_hash:
+                fmt.hu("Updating WorkTree")
+                cmd_args = [ '--force', '--detach', pattern ]
+                if opts['dry']:
+                    print(f'dry-run: git checkout {' '.join(filter(None, cmd_args))}')
+                else:
+                    worktree.git.checkout( *filter(None, cmd_args) )
+            else:
+                fmt.hu("WorkTree is Up-to-Date")
 
-        console.print( rPadding(
-            Panel( worktree.git.log( '-1'),  expand=False, title=pattern, title_align='left', width=120 ),
-            (0,0,0,fmt.pad.sizeu()) )
-        )
+            console.print( rPadding(
+                Panel( worktree.git.log( '-1'),  expand=False, title=pattern, title_align='left', width=120 ),
+                (0,0,0,fmt.pad.sizeu()) )
+            )
 
         section.end()
         config['ok'] = True
@@ -52,6 +52,29 @@ class ConsoleMultiplex(Console):
         for dest in self.outputs.values():
             dest.print(*args, **kwargs)
 
+    def write_through(self, text: str, exclude: set[str] = frozenset()):
+        """Write text to the console and all registered outputs as-is, skipping rich rendering.
+
+        Used for build output, which is already formatted and may contain square
+        brackets that rich would take for markup.
+
+        Args:
+            text (str): The text to write, including its line endings.
+            exclude (set[str], optional): Names of outputs that should not receive the text.
+
+        Returns:
+            None: Writes to the main console (if not quiet) and the registered outputs.
+        """
+        if not self.quiet:
+            self.file.write(text)
+            self.file.flush()
+        for name, dest in self.outputs.items():
+            if name in exclude: continue
+            if isinstance(dest, ConsoleMultiplex): dest.write_through(text)
+            else:
+                dest.file.write(text)
+                dest.file.flush()
+
     def tee(self, new_console: Console, name: str = None):
         """Register a new console output destination.
 
@@ -15,6 +15,8 @@ from contextlib import ContextDecorator
 from datetime import datetime
 from enum import Enum
 
+from src.events import emit
+
 class TaskStatus(Enum):
     """
     Represents the various statuses a task can have.
@@ -40,7 +42,8 @@ class Timer(ContextDecorator):
     This class serves as a context manager and decorator that records the start and end time of a
     code block or function. It calculates the duration of execution and provides status updates
     (PENDING, STARTED, COMPLETED, FAILED). Additionally, the class can serialize and log execution
-    details in JSON format.
+    details in JSON format, as ``phase_start``/``phase_end`` events when the runner
+    provides an event channel.
 
     :ivar name: Name of the timer instance, aiding in identification of timed processes.
     :type name: Optional[str]
@@ -71,6 +74,7 @@ class Timer(ContextDecorator):
         self.start_time = datetime.now()
         self.end_time = None
         self.duration = 'dnf'
+        emit('phase_start', name=self.name)
         return self
 
     def __exit__(self, *exc):
@@ -78,7 +82,9 @@ class Timer(ContextDecorator):
         self.duration = str(self.end_time - self.start_time)[:-3]
         if self.status == TaskStatus.STARTED:
             self.status = TaskStatus.COMPLETED
-        print('json:', json.dumps({self.name:self.get_dict()}, default=str))
+        # Scripts started by hand have no event channel, so the stats go to stdout.
+        if not emit('phase_end', name=self.name, **self.get_dict()):
+            print('json:', json.dumps({self.name:self.get_dict()}, default=str))
         return False
 
     def get_dict(self) -> dict:
@@ -2,6 +2,7 @@
 """CLI argument parsing and setup for the build system."""
 import argparse
 import multiprocessing
+from pathlib import Path
 from types import SimpleNamespace
 
 from src.config import git_base
@@ -40,12 +41,55 @@ def parse_args(opts: SimpleNamespace):
     parser.add_argument("-j", "--jobs", type=int,
                         default=(multiprocessing.cpu_count() - 1) or 1,
                         help=f"Number of parallel jobs (default: {multiprocessing.cpu_count() - 1 or 1})")
+    parser.add_argument("--parallel", type=int, default=1,
+                        help="Number of builds to run at the same time, sharing the --jobs budget (default: 1)")
+    parser.add_argument("--mem-headroom", type=float, default=10,
+                        help="Percent of the total memory kept free when admitting builds and sizing their jobs (default: 10)")
+    parser.add_argument("--mem-per-job", type=float, default=2.0,
+                        help="GiB of memory assumed per job for builds with no recorded peak memory (default: 2.0)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Seconds a build with no recorded history may run before it is killed (default: no limit)")
+    parser.add_argument("--timeout-factor", type=float, default=3.0,
+                        help="Multiple of a build's, or step's, p95 duration it may run before it is killed, 0 disables (default: 3.0)")
+    parser.add_argument("--idle-timeout", type=float, default=1800,
+                        help="Seconds a build may go without output before it is killed, 0 disables (default: 1800)")
+    parser.add_argument("--runner", choices=['process', 'pool'], default='process',
+                        help="Run each build script in a new interpreter, or in a pool of --parallel warm workers"
+                             " (toolchains with a wrapper shell always use a new interpreter) (default: process)")
+    parser.add_argument("--force", action="store_true",
+                        help="Run builds even when their inputs match the last successful run")
+    parser.add_argument("--fetch-jobs", type=int, default=4,
+                        help="Number of clones and fetches to run at the same time, across projects and remotes (default: 4)")
+    parser.add_argument("--object-store", type=Path, default=None,
+                        help="Bare repository every project's repo borrows git objects from (default: objects.git)")
+    parser.add_argument("--no-object-store", action="store_true",
+                        help="Give every project's repo its own copy of the git objects")
+    parser.add_argument("--offline", action="store_true",
+                        help="Resolve remote refs from the ls-remote cache only, and don't clone or fetch")
+    parser.add_argument("--ls-remote-ttl", type=float, default=600,
+                        help="Seconds a remote's cached ref listing is used before it is listed again (default: 600)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Regenerate build configurations instead of loading them from the plan cache")
 
     parser_io = parser.add_argument_group("IO")
     parser_io.add_argument("-q", "--quiet", action="store_true", help="Suppress output")
     parser_io.add_argument("-v", "--verbose", action="store_true", help="Extra output")
     parser_io.add_argument("--list", action="store_true", help="List the configs and quit")
     parser_io.add_argument("--show", action="store_true", help="Show the configuration and quit")
+    parser_io.add_argument("--stats-history", action="store_true",
+                           help="Show duration trends and regressions from the stats database and quit")
+    parser_io.add_argument("--regression", type=float, default=25,
+                           help="Percent slower than the rolling baseline that flags a regression (default: 25)")
+    parser_io.add_argument("--trace", action="store_true",
+                           help="Write a Chrome trace-event timeline of the run to trace.json, for chrome://tracing or Perfetto")
+    parser_io.add_argument("--log-history", type=int, default=5,
+                           help="Number of compressed logs kept per build, the latest included (default: 5)")
+    parser_io.add_argument("--log-section", type=str, default=None,
+                           help="With the 'logs' action, regex of the log sections to show")
+    parser_io.add_argument("--log-run", type=int, default=0,
+                           help="With the 'logs' action, which run to show, 0 being the latest (default: 0)")
+    parser_io.add_argument("--log-raw", action="store_true",
+                           help="With the 'logs' action, show the raw log instead of the clean one")
 
     # Toolchain Options
     toolchain_opts = parser.add_argument_group("Toolchain")
@@ -78,6 +122,9 @@ def parse_args(opts: SimpleNamespace):
 
     parser.parse_args(namespace=opts)
 
+    # Absolute, as the build scripts pass it to git from their project folders.
+    opts.object_store = None if opts.no_object_store else opts.path / (opts.object_store or 'objects.git')
+
     if opts.actions:
         opts.toolchain_actions += opts.actions
         opts.project_actions += opts.actions
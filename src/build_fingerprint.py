@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""Build fingerprints: recognise builds whose inputs are the same as their last successful run."""
+import hashlib
+from pathlib import Path
+from types import SimpleNamespace
+
+from src.git_utils import resolve_build_commit
+from src.history import last_fingerprint
+from src.plan_cache import fingerprint, toolchain_fingerprint
+from src.scheduler import artifact_exists
+
+
+def build_fingerprint( opts:SimpleNamespace, build:SimpleNamespace ) -> str | None:
+    """Hash the inputs of a build.
+
+    That is the commit it builds from, the generated script, the toolchain and the
+    buildtool's ``build_vars``/``config_vars``. The script holds the toolchain, project
+    and build configuration, the snippets it runs and the options that shape the build,
+    like the actions asked for. The options of ``RUN_OPTIONS``, such as the command
+    line, job counts or ``--force``, are left out of it, so they don't count.
+
+    :return: The fingerprint, or None when the commit or the script can't be found.
+    """
+    commit = resolve_build_commit(opts, build)
+    script_path = Path(build.script_path)
+    if not commit or not script_path.exists(): return None
+
+    buildtool = getattr(build, 'buildtool', SimpleNamespace())
+    digest = hashlib.sha256()
+    digest.update(commit.encode())
+    digest.update(script_path.read_bytes())
+    digest.update(toolchain_fingerprint(build.toolchain).encode())
+    digest.update(fingerprint([getattr(buildtool, 'build_vars', []), getattr(buildtool, 'config_vars', [])]).encode())
+    return digest.hexdigest()
+
+
+def artifacts_present( build:SimpleNamespace ) -> bool:
+    """Check that what the build produced last time is still on disk.
+
+    Every artifact in ``build.produces`` has to exist, a build that declares none
+    needs at least its worktree.
+    """
+    produces = getattr(build, 'produces', {})
+    if not produces: return Path(build.source_path).exists()
+    return all(artifact_exists(build, key) for key in produces)
+
+
+def is_up_to_date( opts:SimpleNamespace, build:SimpleNamespace ) -> bool:
+    """True when ``build.fingerprint`` matches the last successful run and its artifacts still exist."""
+    if getattr(opts, 'force', False) or not getattr(build, 'fingerprint', None): return False
+    return build.fingerprint == last_fingerprint(opts, build) and artifacts_present(build)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""Build log sink: write build output to compressed, indexed raw and clean logs as it streams."""
+import io
+import json
+import re
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+
+from rich.console import Console
+from rich.table import Table
+
+from src.ConsoleMultiplex import ConsoleMultiplex
+
+console = ConsoleMultiplex()
+
+ANSI_ESCAPE = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]')
+SECTION_MARKER = b'section:'   # written by fmt.Section in build scripts when AUTOBUILD_SECTION_MARKERS is set
+
+
+def log_paths( directory:Path, name:str, suffix:str, run:int = 0 ) -> tuple[Path, Path]:
+    """The compressed log and its section index for a run, 0 being the latest."""
+    stem = f"{name}.{run}" if run else name
+    return directory / f"{stem}{suffix}.gz", directory / f"{stem}{suffix}.idx"
+
+
+def rotate_logs( directory:Path, name:str, suffix:str, keep:int ):
+    """Shift the previous runs of a log up by one, dropping those beyond ``keep``."""
+    for run in range(max(keep, 1) - 1, -1, -1):
+        for path, older in zip(log_paths(directory, name, suffix, run), log_paths(directory, name, suffix, run + 1)):
+            if not path.exists(): continue
+            if run + 1 >= keep: path.unlink()
+            else: path.replace(older)
+
+
+# MARK: Writer
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │ __      __   _ _                                                           │
+# │ \ \    / / _(_) |_ ___ _ _                                                 │
+# │  \ \/\/ / '_| |  _/ -_) '_|                                                │
+# │   \_/\_/|_| |_|\__\___|_|                                                  │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+class SectionedGzipFile(io.RawIOBase):
+    """
+    A write-only gzip file that starts a new gzip member for every section.
+
+    Concatenated members are still one valid gzip file, so ``zcat`` and
+    ``gzip.open`` read it as a whole. The offset of each member is kept in a small
+    JSON index next to it, so a single section can be decompressed on its own.
+
+    :ivar sections: Name, compressed offset and uncompressed offset of each section.
+    :type sections: list[dict]
+    """
+    def __init__(self, path:Path, index_path:Path, first_section:str):
+        super().__init__()
+        self.file = open(path, 'wb')
+        self.index_path = index_path
+        self.sections:list[dict] = []
+        self.size = 0
+        self._compressor = None
+        self.mark(first_section)
+
+    def writable(self) -> bool: return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.file.write(self._compressor.compress(data))
+        self.size += len(data)
+        return len(data)
+
+    def sync(self):
+        """Flush what was written so far, so the log can be followed while the build runs."""
+        self.file.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        self.file.flush()
+
+    def mark(self, name:str):
+        """Close the current gzip member and start a new one for the named section."""
+        if self._compressor is not None:
+            self.file.write(self._compressor.flush(zlib.Z_FINISH))
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+        self.sections.append({'name': name, 'offset': self.file.tell(), 'start': self.size})
+
+    def close(self):
+        """Left open when a wrapping stream is closed, like a console popped from a multiplexer,
+        :meth:`finish` ends the file."""
+
+    def finish(self, status:str | None = None):
+        """End the last gzip member and write the index."""
+        if self.file.closed: return
+        self.file.write(self._compressor.flush(zlib.Z_FINISH))
+        self.file.close()
+        self.index_path.write_text(json.dumps({
+            'status': status, 'size': self.size, 'sections': self.sections}, indent=1), encoding='utf-8')
+
+
+# MARK: Build Log
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  ___      _ _    _   _                                                     │
+# │ | _ )_  _(_) |__| | | |   ___  __ _                                        │
+# │ | _ \ || | | / _` | | |__/ _ \/ _` |                                       │
+# │ |___/\_,_|_|_\__,_| |____\___/\__, |                                       │
+# │                               |___/                                        │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+class BuildLog:
+    """
+    The raw and clean log files of a single build.
+
+    Script output goes to :meth:`write` and lands in the raw log as the bytes it
+    arrived as, and, with ANSI escapes stripped in the same pass, in the clean log.
+    Neither goes through rich, so square brackets in compiler output survive and
+    nothing has to be re-read once the build is done. Messages from the build
+    runner itself, headings, tables and error panels, are printed through
+    :attr:`console`, which renders them into both files.
+
+    Both logs are gzip compressed with a section index, see :class:`SectionedGzipFile`,
+    and the previous ``keep - 1`` runs of each are kept as ``<build>.<n>.log.gz``.
+
+    :ivar raw: The raw log.
+    :type raw: SectionedGzipFile
+    :ivar clean: The clean log.
+    :type clean: SectionedGzipFile
+    :ivar console: Renders to the raw log, with a plain console for the clean log tee'd.
+    :type console: ConsoleMultiplex
+    :ivar status: Stored in the index when the log is closed, so the viewer can tell failed runs.
+    :type status: str | None
+    """
+    def __init__(self, project:SimpleNamespace, build:SimpleNamespace, keep:int = 5):
+        raw_dir, clean_dir = project.path / 'logs-raw', project.path / 'logs-clean'
+        rotate_logs(raw_dir, build.name, '.log', keep)
+        rotate_logs(clean_dir, build.name, '.txt', keep)
+        self.raw = SectionedGzipFile(*log_paths(raw_dir, build.name, '.log'), build.name)
+        self.clean = SectionedGzipFile(*log_paths(clean_dir, build.name, '.txt'), build.name)
+        self.status:str | None = None
+        # write_through keeps rendered messages and raw output in order.
+        self.console = ConsoleMultiplex(
+            file=io.TextIOWrapper(self.raw, encoding='utf-8', write_through=True), force_terminal=True)
+        self.console.tee(Console(
+            file=io.TextIOWrapper(self.clean, encoding='utf-8', write_through=True), no_color=True), 'clean')
+
+    def write(self, data:bytes) -> str:
+        """Append a chunk of script output to both logs, and return it decoded."""
+        self.raw.write(data)
+        text = data.decode('utf-8', errors='backslashreplace')
+        self.clean.write(ANSI_ESCAPE.sub('', text).encode('utf-8'))
+        self.raw.sync()
+        self.clean.sync()
+        return text
+
+    def mark(self, name:str):
+        """Start a new section in both logs."""
+        self.raw.mark(name)
+        self.clean.mark(name)
+
+    def close(self):
+        """Finish both logs and write their indexes."""
+        self.raw.finish(self.status)
+        self.clean.finish(self.status)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# MARK: Viewer
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │ __   ___                                                                   │
+# │ \ \ / (_)_____ __ _____ _ _                                                │
+# │  \ V /| / -_) V  V / -_) '_|                                               │
+# │   \_/ |_\___|\_/\_/\___|_|                                                 │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def read_section( log_path:Path, index:dict, number:int ) -> str:
+    """Decompress a single section of an indexed log."""
+    sections = index['sections']
+    with open(log_path, 'rb') as log_file:
+        log_file.seek(sections[number]['offset'])
+        if number + 1 < len(sections):
+            data = log_file.read(sections[number + 1]['offset'] - sections[number]['offset'])
+        else: data = log_file.read()
+    return zlib.decompressobj(31).decompress(data).decode('utf-8', errors='backslashreplace')
+
+
+def show_logs( opts:SimpleNamespace ):
+    """Show the logs of the matching builds without decompressing more than needed.
+
+    With ``--log-section`` the sections whose name matches are printed. Otherwise
+    a failed run shows the section it failed in, the last one started, and any
+    other run shows its table of sections. ``--log-run`` picks an older run and
+    ``--log-raw`` the raw log instead of the clean one.
+    """
+    for project in opts.projects.values():
+        directory, suffix = (project.path / 'logs-raw', '.log') if opts.log_raw else (project.path / 'logs-clean', '.txt')
+        for build in project.build_configs.values():
+            log_path, index_path = log_paths(directory, build.name, suffix, opts.log_run)
+            if not index_path.exists():
+                console.print(f"[yellow]{project.name}/{build.name}: no indexed log for run {opts.log_run}[/yellow]")
+                continue
+            index = json.loads(index_path.read_text(encoding='utf-8'))
+            sections = index['sections']
+
+            if opts.log_section:
+                chosen = [i for i, s in enumerate(sections) if re.search(opts.log_section, s['name'])]
+            elif index.get('status') in ('Failed', 'TimedOut'):
+                chosen = [len(sections) - 1]
+            else:
+                table = Table(title=f"{project.name}/{build.name} - {index.get('status')}", highlight=True, min_width=80)
+                table.add_column("#", justify="right")
+                table.add_column("Section", style="cyan")
+                table.add_column("Size", justify="right")
+                ends = [s['start'] for s in sections[1:]] + [index['size']]
+                for i, (section, end) in enumerate(zip(sections, ends)):
+                    table.add_row(str(i), section['name'], f"{end - section['start']:,}")
+                console.print(table)
+                continue
+
+            for i in chosen:
+                console.rule(f"{project.name}/{build.name} - {sections[i]['name']}")
+                console.write_through(read_section(log_path, index, i))
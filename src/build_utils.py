@@ -1,21 +1,33 @@
 #!/usr/bin/env python
 """Build processing utilities: fetch, process builds/projects, stats."""
+import gzip
+import io
 import json
 import os
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from time import sleep
 from types import SimpleNamespace
 
 from rich import print
 from rich.console import Console
+from rich.markup import escape
 from rich.table import Table
 
 from src import format as fmt
+from src.build_fingerprint import build_fingerprint, is_up_to_date
+from src.build_log import BuildLog, SectionedGzipFile, SECTION_MARKER, log_paths
 from src.ConsoleMultiplex import ConsoleMultiplex, TeeOutput
 from src.error import handle_error
-from src.generate import write_namespace
-from src.run import stream_command
-from src.utils import get_interior_dict, process_log_null
+from src.events import EventLog
+from src.generate import RUN_OPTIONS_ENV, run_options, write_namespace
+from src.history import load_history, record_history, expected_duration, expected_rss_per_job
+from src.resources import TreeSampler, format_bytes
+from src.run import kill_process_tree, stream_command
+from src.scheduler import MemoryBudget, schedule_builds
+from src.worker_pool import ScriptPool
+from src.utils import get_interior_dict
+from src.watchdog import Watchdog, build_limits
 
 console = ConsoleMultiplex()
 pretendio = type('obj', (object,), {'write': lambda self, v: print(v)})()
@@ -36,18 +48,31 @@ pretendio = type('obj', (object,), {'write': lambda self, v: print(v)})()
 Args:
     opts (SimpleNamespace): Global opts.
     build (SimpleNamespace): Build object.
+    jobs (int): The share of the job budget given to this build, defaults to opts.jobs.
+    pool (ScriptPool): Runs the script in a warm worker instead of a new interpreter, with --runner pool.
+    events (EventLog): The run's event log, the script's phase and command events are collected into it.
 
 Side effects:
     Runs pwsh/python script, captures logs/stats.
 """
-def process_build( opts:SimpleNamespace, build:SimpleNamespace ):
+def process_build( opts:SimpleNamespace, build:SimpleNamespace, jobs:int|None=None, pool:ScriptPool|None=None,
+                   events:EventLog|None=None, limits:SimpleNamespace|None=None ):
     """
 
     :param opts:
     :param build:
+    :param jobs:
+    :param pool: Worker pool to run the script in, used when the toolchain has no wrapper shell.
+    :param events: Event log of the run, without one the script reports its timings on stdout.
+    :param limits: Time limits from ``build_limits``, a build that passes one is killed and marked "TimedOut".
     :return:
     """
     project = build.project
+    jobs = jobs or opts.jobs
+    # When builds run side by side the console tee and section nesting are
+    # shared global state, so each build keeps to its own log and prefixes its
+    # lines on the terminal instead.
+    concurrent = getattr(opts, 'parallel', 1) > 1
 
     if opts.verbose:
         console.line()
@@ -59,6 +84,7 @@ def process_build( opts:SimpleNamespace, build:SimpleNamespace ):
     setattr( build, 'stats', { # type: ignore[attr-defined]
         'status': "dnf",
         'duration':"dnr",
+        'jobs': jobs,
         'subs':{}
     })
     stats = build.stats
@@ -77,13 +103,25 @@ def process_build( opts:SimpleNamespace, build:SimpleNamespace ):
         build.stats |= {"status":'Disabled'}
         return
 
+    # Nothing changed since the last successful run, so don't start anything.
+    setattr( build, 'fingerprint', build_fingerprint( opts, build ) )
+    if is_up_to_date( opts, build ):
+        build.stats |= {"status":'Up-to-date'}
+        fmt.h(f"Up-to-date: {build.name}")
+        if events: events.record('build_end', build, status='Up-to-date')
+        return
+
     # =====================[ stdout Logging ]======================-
-    log_path = project.path / f"logs-raw/{build.name}.log"
     with (
-        open( file=log_path, mode='w', buffering=1, encoding="utf-8" ) as build_log,
-        TeeOutput(console, Console( file=build_log, force_terminal=True ), build.name ),
-        fmt.Section("Build: " + build.name)
+        BuildLog( project, build, opts.log_history ) as build_log,
+        TeeOutput(console, build_log.console, build.name )
+            if not concurrent else nullcontext(),
+        fmt.Section("Build: " + build.name) if not concurrent else nullcontext()
     ):
+        build_console = build_log.console if concurrent else console
+        prefix = f'[cyan]{escape(build.name)}[/cyan] | ' if concurrent else ''
+        # script output bypasses rich, so its prefix is plain text
+        raw_prefix = (f'\x1b[36m{build.name}\x1b[0m | ' if console.is_terminal else f'{build.name} | ') if concurrent else ''
 
         # =================[ Build Heading / Config ]==================-
         fmt.h( "Script: " + build.script_path.as_posix() )
@@ -111,35 +149,94 @@ def process_build( opts:SimpleNamespace, build:SimpleNamespace ):
         # ====================[ Run Build Script ]=====================-
         # Our little output handler which captures the lines and looks for data to
         # use in the statistics
-        def monitor_output( line ):
+        def echo( text:str ):
+            if concurrent: text = ''.join(raw_prefix + line for line in text.splitlines(keepends=True))
+            console.write_through( text, exclude={build.name} )
+
+        output_bytes = 0
+        def monitor_output( lines:list[bytes] ):
             """
+            Receives the script's output a batch of lines at a time, pulls out the
+            'json:' stats records of scripts without an event channel, writes the rest
+            to the build logs and echoes it to the console and project log, all without
+            going through rich.
 
-            :param line:
+            :param lines:
             """
-            if line.startswith('json:'): stats['subs'].update(json.loads( line[6:] ))
-            else: print( line )
+            nonlocal output_bytes
+            watchdog.touch()
+            data = b'\n'.join(lines)
+            output_bytes += len(data) + 1
+            if b'json:' in data or SECTION_MARKER in data:
+                pending = []
+                for line in lines:
+                    if line.startswith(b'json:'): stats['subs'].update(json.loads( line[6:] ))
+                    elif line.startswith(SECTION_MARKER):
+                        # Everything before the marker belongs to the previous section.
+                        if pending: echo( build_log.write( b'\n'.join(pending) + b'\n' ) )
+                        pending = []
+                        build_log.mark( line[len(SECTION_MARKER):].strip().decode('utf-8', errors='backslashreplace') )
+                    else: pending.append( line )
+                if pending: echo( build_log.write( b'\n'.join(pending) + b'\n' ) )
+                return
+            echo( build_log.write( data + b'\n' ) )
+
+        def collect_errors( lines:list[bytes] ):
+            watchdog.touch()
+            errors.extend( line.decode('utf-8', errors='backslashreplace') for line in lines )
 
         errors:list = []
         shell = getattr(build.toolchain, 'shell', [])
         env = getattr(build.toolchain, 'env', None )
 
+        # The generated scripts read their share of the job budget from the environment.
+        # fmt.Section announces itself on stdout so the logs get a section index.
+        # Options that only shape the run come the same way, see RUN_OPTIONS.
+        env = {**(env or os.environ), 'AUTOBUILD_JOBS': str(jobs), 'AUTOBUILD_SECTION_MARKERS': '1',
+               RUN_OPTIONS_ENV: run_options( opts )}
+        if events: env |= events.channel( build )
+
         cmd = f'python {build.script_path.as_posix()}'
         run_cmd = ' '.join( shell + [f'"{cmd}"']) if shell else cmd
-        fmt.h("RunCmd: " + run_cmd)
+        # A wrapper shell sets up the environment for the script, so those keep their own interpreter.
+        in_pool = pool is not None and not shell
+        fmt.h(f"{prefix}RunCmd: {run_cmd}{' (worker pool)' if in_pool else ''}")
+        if events: events.record('build_start', build, jobs=jobs, runner='pool' if in_pool else 'process')
+        returncode = None
+        # CPU, memory and I/O of the script and everything it starts, on Linux.
+        sampler = TreeSampler()
+
+        # A script run on its own leads a new process group, so a hung build goes down
+        # with everything it started. In a worker only the worker's children are killed.
+        new_session = os.name == 'posix' and not in_pool
+        def kill():
+            if sampler.pid: kill_process_tree( sampler.pid, group=new_session, include_root=not in_pool )
+        watchdog = Watchdog( limits or SimpleNamespace(total=None, steps={}, idle=None), kill,
+                             events.channel_path( build ) if events else None )
         try:
             stats |= { 'start_time':datetime.now() }
-            proc = stream_command( run_cmd, env=env,
-                                   stdout_handler=monitor_output,
-                                   stderr_handler=lambda msg: errors.append(msg)
-                                   )
-            print( "Post process")
+            watchdog.start()
+            if in_pool:
+                proc = pool.run( build.script_path, env=env, cwd=project.path, text=False,
+                                 stdout_handler=monitor_output,
+                                 stderr_handler=collect_errors,
+                                 sampler=sampler )
+            else:
+                proc = stream_command( run_cmd, env=env, cwd=project.path, quiet=concurrent,
+                                       batch=True, text=False, sampler=sampler,
+                                       stdout_handler=monitor_output,
+                                       stderr_handler=collect_errors,
+                                       **({'start_new_session': True} if new_session else {})
+                                       )
+            print( prefix + "Post process")
             end_time = datetime.now()
             stats |= {
                 'status': "Dry-Run" if opts.dry else "Completed",
                 'end_time': end_time,
                 'duration': end_time - stats["start_time"]
             }
-            print( "status updated after process")
+            print( prefix + "status updated after process")
+            returncode = proc.returncode
             proc.check_returncode()
         except KeyboardInterrupt:
             end_time = datetime.now()
@@ -157,77 +254,146 @@ def process_build( opts:SimpleNamespace, build:SimpleNamespace ):
             except KeyboardInterrupt as e: raise e
             print("continuing...")
         except Exception as e:
+            returncode = getattr(e, 'returncode', None)
             end_time = datetime.now()
             stats |= {
-                "status": "Failed",
+                "status": "TimedOut" if watchdog.reason else "Failed",
                 "end_time": end_time,
                 "duration": end_time - stats["start_time"]
             }
-            handle_error(f"process_build cmd={run_cmd}", e, opts)
+            if watchdog.reason:
+                stats['reason'] = watchdog.reason
+                build_console.print( f"[red]{build.name} was killed, it {watchdog.reason}[/red]" )
+            else: handle_error(f"process_build cmd={run_cmd}", e, opts)
             if errors:
-                console.print( Panel( '\n'.join( errors ), title='stderr', style="red"))
+                build_console.print( Panel( '\n'.join( errors ), title=f'{build.name} stderr', style="red"))
+
+        finally:
+            watchdog.stop()
+
+        if sampler.usage: stats['resources'] = sampler.usage
 
-        # TODO create a timeout for the processing, something reasonable.
-        #   this should be defined in the build config as the largest possible build time that is expected.
-        #   that way it can trigger a check of the system if it is failing this test.
+        # ====================[ Collect Events ]=======================-
+        if events:
+            for event in events.collect( build ):
+                if event['event'] == 'phase_end':
+                    stats['subs'][event['name']] = {k: event[k] for k in ('status', 'duration', 'returnvalue') if k in event}
+            events.record('build_end', build, status=stats['status'], duration=stats['duration'],
+                          returncode=returncode, output_bytes=output_bytes, **stats.get('resources', {}),
+                          **({'reason': stats['reason']} if 'reason' in stats else {}))
 
         table = Table( highlight=True, min_width=80, show_header=False )
         table.add_row(
             build.name, f"{stats['status']}", f"{stats['duration']}",
-            style="red" if stats["status"] == "Failed" else "green", )
-        console.print( table )
+            style="red" if stats["status"] in ("Failed", "TimedOut") else "green", )
+        build_console.print( table )
+        if concurrent: console.print( table )
+        build_log.status = stats['status']
 
     # ==================[ Output Log Processing ]==================-
-    fmt.h1( "Post Run Actions" )
-    fmt.hu( "Clean Log" )
-    cleanlog_path = (project.path / f"logs-clean/{build.name}.txt")
+    # The clean log is written while the build streams, unless the build brings its own cleaner.
     if 'clean_log' in  get_interior_dict(build).keys():
-        clean_log = build.clean_log
-    else: clean_log = process_log_null
+        fmt.h1( "Post Run Actions" )
+        fmt.hu( "Clean Log" )
+        log_path, _ = log_paths( project.path / 'logs-raw', build.name, '.log' )
+        clean_log = SectionedGzipFile( *log_paths( project.path / 'logs-clean', build.name, '.txt' ), build.name )
+        with (gzip.open(log_path, 'rt', encoding='utf-8', errors='backslashreplace') as log_raw,
+              io.TextIOWrapper( clean_log, encoding='utf-8' ) as log_clean):
+            build.clean_log( log_raw, log_clean )
+            log_clean.flush()
+        clean_log.finish( stats['status'] )
+
+
+def prepare_project(opts: SimpleNamespace, project: SimpleNamespace):
+    """Create the project log folders and show the project configuration when verbose."""
+    os.makedirs(project.path / "logs-raw", exist_ok=True)
+    os.makedirs(project.path / "logs-clean", exist_ok=True)
+    setattr(project, 'cancelled', False)
 
-    with (open(log_path, encoding='utf-8') as log_raw,
-          open( cleanlog_path, "w", encoding='utf-8' ) as log_clean):
-        clean_log( log_raw, log_clean )
+    if opts.verbose:
+        fmt.t2(project.name)
+        console.rule("Project Config:")
+        write_namespace(pretendio, project, 'project')
+        console.rule("Build Configurations")
+        for build in project.build_configs.values():
+            fmt.h(build.name)
 
 
-def process_project(opts: SimpleNamespace, project: SimpleNamespace):
-    """Process project actions (fetch) and matching builds."""
-    os.chdir(project.path)
+def process_projects(opts: SimpleNamespace, projects: dict[str, SimpleNamespace], events: EventLog | None = None):
+    """Process the matching builds of every project through one scheduler.
 
-    os.makedirs(project.path / "logs-raw", exist_ok=True)
-    os.makedirs(project.path / "logs-clean", exist_ok=True)
+    All builds go to a single :func:`schedule_builds` call, so a build that
+    consumes another project's artifact starts as soon as that artifact exists,
+    rather than after the whole upstream project. With ``--parallel 1`` builds
+    still run project by project, each wrapped in its project log.
 
-    log_path = project.path / f"logs-raw/{project.name}.log"
-    with (
-        open(file=log_path, mode='w', buffering=1, encoding="utf-8") as log_file,
-        TeeOutput(console, Console(file=log_file, force_terminal=True), project.name),
-        fmt.Section("Project: " + project.name)
-    ):
-        if opts.verbose:
-            fmt.t2(project.name)
-            console.rule("Project Config:")
-            write_namespace(pretendio, project, 'project')
-            console.rule("Build Configurations")
-            for build in project.build_configs.values():
-                fmt.h(build.name)
-
-        project_total = len(project.build_configs)
-        build_num = 0
-        for build in project.build_configs.values():
-            build_num += 1
-            console.set_window_title(f"{project.name}[{build_num}:{project_total}] - {build.name}")
+    Durations from previous runs order the builds longest first, and this run's
+    timings are recorded for the next one, along with each build's peak memory,
+    which with the free memory decides how many builds start and with how many
+    jobs. With ``--runner pool`` the scripts run
+    in a pool of ``--parallel`` warm worker processes. The events of every build
+    go to ``events``, or to a new ``events.jsonl`` when the caller has no event log.
+    """
+    for project in projects.values():
+        prepare_project(opts, project)
+
+    opened_logs:set[str] = set()
+    counters:dict[str, int] = {}
+    @contextmanager
+    def project_log( project:SimpleNamespace ):
+        """Tee the console into the project log, truncated by the first of its builds to run."""
+        log_path = project.path / f"logs-raw/{project.name}.log"
+        mode = 'a' if project.name in opened_logs else 'w'
+        opened_logs.add(project.name)
+        with open(file=log_path, mode=mode, buffering=1, encoding="utf-8") as log_file:
+            with TeeOutput(console, Console(file=log_file, force_terminal=True), project.name) as tee:
+                yield tee
+
+    def run_build( opts:SimpleNamespace, build:SimpleNamespace, jobs:int ):
+        project = build.project
+        if project.cancelled:
+            setattr( build, 'stats', {'status':'Cancelled', 'duration':'dnr', 'subs':{}} )
+            return
+
+        counters[project.name] = counters.get(project.name, 0) + 1
+        concurrent = getattr(opts, 'parallel', 1) > 1
+        if not concurrent:
+            console.set_window_title(
+                f"{project.name}[{counters[project.name]}:{len(project.build_configs)}] - {build.name}")
+
+        with (
+            project_log(project) if not concurrent else nullcontext(),
+            fmt.Section("Project: " + project.name) if not concurrent else nullcontext()
+        ):
             try:
-                process_build(opts, build)
+                process_build(opts, build, jobs, pool, events,
+                              build_limits(opts, build, histories[project.name]))
             except KeyboardInterrupt:
                 print(f'"Cancelling project "{project.name}", CTRL+C again to cancel all projects"')
-                try:
-                    from time import sleep
-                    sleep(3)
-                except KeyboardInterrupt as e:
-                    console.pop(project.name)
-                    raise e
+                from time import sleep
+                sleep(3)
+                project.cancelled = True
                 print("continuing")
 
+    builds = [build for project in projects.values() for build in project.build_configs.values()]
+    histories = {name: load_history(opts, project) for name, project in projects.items()}
+    expected = [expected_duration(opts, build, histories[build.project.name]) for build in builds]
+    memory = MemoryBudget(opts, [expected_rss_per_job(build, histories[build.project.name]) for build in builds])
+    pool = ScriptPool(getattr(opts, 'parallel', 1)) if getattr(opts, 'runner', 'process') == 'pool' else None
+    own_events = events is None
+    if own_events: events = EventLog(opts.path / 'events.jsonl')
+    try:
+        schedule_builds(opts, builds, run_build, expected, memory)
+    finally:
+        if pool: pool.shutdown()
+        if own_events: events.close()
+        record_history(opts, projects)
+
+
+def process_project(opts: SimpleNamespace, project: SimpleNamespace):
+    """Process the matching builds of a single project."""
+    process_projects(opts, {project.name: project})
+
 
 
 # (show_statistics moved to src/build_utils.py)
@@ -266,6 +432,13 @@ def show_statistics( opts:SimpleNamespace ):
             sub_columns.append( action )
             table.add_column( action )
 
+    # Sampled on Linux only, so the columns only show when there is something in them.
+    show_resources = any('resources' in (getattr(build, 'stats', None) or {})
+                         for project in opts.projects.values() for build in project.build_configs.values())
+    if show_resources:
+        for column_name in ["CPU", "Peak RSS", "Avg RSS", "Read/Write"]:
+            table.add_column( column_name, justify="right" )
+
     for project in opts.projects.values():
         for build in project.build_configs.values():
             if not getattr(build, 'stats', None): continue
@@ -277,12 +450,12 @@ def show_statistics( opts:SimpleNamespace ):
             colour = "green"
             status = build.stats['status']
             match status:
-                case 'Completed':
+                case 'Completed' | 'Up-to-date':
                     colour = "green"
                     pass
-                case 'Cancelled' | 'Dry-Run' | 'Skipped', 'Disabled':
+                case 'Cancelled' | 'Dry-Run' | 'Skipped' | 'Disabled' | 'Blocked':
                     colour = "yellow"
-                case 'Failed':
+                case 'Failed' | 'TimedOut':
                     colour = "red"
 
             r.append(f"[{colour}]{status}[/{colour}]")
@@ -296,6 +469,12 @@ def show_statistics( opts:SimpleNamespace ):
                     r.append(f"[red]{sub['duration']}[/red]")
                 else: r.append( str(sub['duration']) )
 
+            if show_resources:
+                usage = build.stats.get('resources')
+                if not usage: r += ['n/a'] * 4
+                else: r += [f"{usage['cpu_time']:.1f}s", format_bytes(usage['peak_rss']), format_bytes(usage['avg_rss']),
+                            f"{format_bytes(usage['read_bytes'])}/{format_bytes(usage['write_bytes'])}"]
+
             table.add_row( *r )
     console.print(table)
 
@@ -148,11 +148,15 @@ project_base = SimpleNamespace(
     buildtools    = list[SimpleNamespace](),       #
     toolchains    = gopts.toolchains.values(),     # default is all of them
     build_configs = dict[str,SimpleNamespace](),   #
+    produces      = dict[str,str](),               # artifact key -> glob relative to build.source_path, merged into every build
+    consumes      = dict[str,list[str]](),         # build action -> artifact keys it needs, merged into every build
     skipkeys      = [                              # A list of keys that are skipped when writing out configuration to build scripts.
         'sources',
         'buildtools',
         'toolchains',
-        'build_configs'
+        'build_configs',
+        'produces',
+        'consumes',
     ]
 )
 
@@ -171,12 +175,16 @@ build_base = SimpleNamespace({**{},**{
     'source_def'    :SimpleNamespace(), #
     'disabled'      :False,
     'configure_funcs':list(),
+    'produces'      :dict[str,str](),       # artifact key -> glob relative to source_path, eg. {'godot.windows.editor.x86_64':'bin/godot.windows.editor*.x86_64*'}
+    'consumes'      :dict[str,list[str]](), # build action -> artifact keys, the scheduler waits for their producers
     'skipkeys'      :[  # A list of keys that are skipped when writing out configuration to build scripts.
         'project',
         'toolchain',
         'buildtool',
         'configure_funcs',
         'source_def',
+        'produces',
+        'consumes',
     ],
 }})
 
@@ -248,6 +256,8 @@ git_base = SimpleNamespace({**vars(source_base), **{
     'url'           :str(),
     'ref'           :'HEAD',
     'gitdir'        :'git', # relative to project path.
+    'filter'        :None,  # partial clone filter, eg. 'blob:none' downloads file contents as checkouts need them.
+    'depth'         :None,  # shallow clone of this many commits, deepened when a wanted commit is older.
 
 }})
 
@@ -9,6 +9,8 @@ from typing import cast
 from src import format as fmt
 from src.config import gopts
 from src.error import handle_error
+from src.layer import flatten
+from src.plan_cache import plan_key, load_plan, save_plan
 from src.utils import setattrdefault
 
 
@@ -121,6 +123,9 @@ def import_projects(opts: SimpleNamespace) -> dict:
         # Skip directories that are in use
         if parent_name in ['src', 'share', 'toolchains', 'test']:
             continue
+        # match --project-regex before paying for the import
+        if not fmt.re.search(opts.project_regex, parent_name):
+            continue
         if opts.verbose:
             fmt.hu(config_file)
 
@@ -130,10 +135,6 @@ def import_projects(opts: SimpleNamespace) -> dict:
 
         opts.modules[parent_name] = project_module
 
-    # Filter the results with the project-regex
-    opts.modules = {k: v for k, v in opts.modules.items()
-                    if fmt.re.search(opts.project_regex, k)}
-
     fmt.h("Generating Build Configurations")
     for k,v in opts.modules.items():
         if opts.verbose:
@@ -141,16 +142,29 @@ def import_projects(opts: SimpleNamespace) -> dict:
         # update module sources with overrides
         v.sources = {**getattr(v, 'sources', {}), **opts.sources}
 
+        # reuse the expansion from a previous run when none of its inputs changed
+        key = plan_key( opts, v )
+        if (project := load_plan( opts, k, key )) is not None:
+            if opts.verbose: fmt.h(f"loaded {len(project.build_configs)} builds from cache")
+            projects[k] = project
+            continue
+
         # generate the project configurations
         try: project : SimpleNamespace = v.generate( opts )
         except Exception as e:
             handle_error(f"project_module.generate({k})", e, opts)
             continue
         setattr(project, 'name', k) # type: ignore[attr-defined]
+
+        # match --filter <regex>, and resolve the copy-on-write layers from expansion
+        builds: dict = project.build_configs
+        project.build_configs = {name: flatten(build) for name, build in builds.items()
+            if fmt.re.search( opts.build_regex, build.name )}
+
+        save_plan( opts, k, key, project )
         projects[k] = project
 
     # Verify required project attributes
-    # filter the build configurations
     for project in projects.values():
         # All project configs must have a valid gitdef with a URL
         sources : dict = getattr(project, 'sources') # type: ignore[attr-defined]
@@ -159,11 +173,6 @@ def import_projects(opts: SimpleNamespace) -> dict:
             if gopts.debug: raise Exception(msg)
             fmt.hu(f"[red]{msg}")
 
-        # match --filter <regex>
-        builds: dict = project.build_configs
-        project.build_configs = {k: v for k, v in builds.items()
-            if fmt.re.search( opts.build_regex, v.name )}
-
     # Filter projects with zero valid build configurations
     projects = {v.name: v for v in projects.values() if len(v.build_configs)}
 
@@ -183,6 +192,13 @@ def import_projects(opts: SimpleNamespace) -> dict:
             setattr(build, 'project', project)
             setattr(build, 'script_path', project.path / f"{build.name}.py")
 
+            # project level artifact declarations apply to every build
+            setattr(build, 'produces', {**getattr(project, 'produces', {}), **getattr(build, 'produces', {})})
+            consumes = {k: list(v) for k, v in getattr(project, 'consumes', {}).items()}
+            for action, keys in getattr(build, 'consumes', {}).items():
+                consumes[action] = consumes.get(action, []) + [k for k in keys if k not in consumes.get(action, [])]
+            setattr(build, 'consumes', consumes)
+
             # collect build verbs for list display
             opts.build_verbs += [verb for verb in getattr(build, 'verbs', [])
                                  if verb not in opts.build_verbs]
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""Build events: typed records of each build phase, written by build scripts to a channel the runner collects."""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+# Set by the runner for every build script, the file its events are appended to.
+EVENTS_ENV = 'AUTOBUILD_EVENTS'
+
+
+# MARK: Emit
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  ___       _ _                                                             │
+# │ | __|_ __ (_) |_                                                           │
+# │ | _|| '  \| |  _|                                                          │
+# │ |___|_|_|_|_|\__|                                                          │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def emit( event:str, **fields ) -> bool:
+    """Send an event from a build script to the runner.
+
+    The channel is a file of JSON lines named by :data:`EVENTS_ENV`, one per build,
+    so it works the same through wrapper shells, in worker pool processes and on
+    every platform, and everything written is there once the script has exited.
+    Each event is appended with a single write.
+
+    :param event: The event type, e.g. ``phase_start`` or ``command_end``.
+    :param fields: The event's data, anything ``json`` can't encode is stored as a string.
+    :return: False when the script wasn't started by the runner, so the caller can fall back.
+    """
+    path = os.environ.get(EVENTS_ENV)
+    if not path: return False
+    line = json.dumps({'event': event, 'time': time.time(), **fields}, default=str) + '\n'
+    try:
+        with open(path, 'a', encoding='utf-8') as events_file:
+            events_file.write(line)
+    except OSError:
+        return False
+    return True
+
+
+def read_events( path:Path ) -> list[dict]:
+    """Read an events file, skipping a torn last line."""
+    if not path.exists(): return []
+    events = []
+    with open(path, encoding='utf-8') as events_file:
+        for line in events_file:
+            try: events.append(json.loads(line))
+            except json.JSONDecodeError: pass
+    return events
+
+
+# MARK: Event Log
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  ___             _     _                                                   │
+# │ | __|_ _____ _ _| |_  | |   ___  __ _                                      │
+# │ | _|\ V / -_) ' \  _| | |__/ _ \/ _` |                                     │
+# │ |___|\_/\___|_||_\__| |____\___/\__, |                                     │
+# │                                 |___/                                      │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+class EventLog:
+    """
+    The events of a run, written to ``events.jsonl`` as they happen.
+
+    The runner records its own events, like a build starting or ending, with
+    :meth:`record`, or a start and end pair around a block with :meth:`span`.
+    Each build script gets a channel from :meth:`channel`, and :meth:`collect`
+    moves what it emitted into the run's log once it exits, adding the project
+    and build names. Safe to use from concurrently running builds.
+
+    :ivar path: The run's events file.
+    :type path: Path
+    """
+    def __init__(self, path:Path):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8', buffering=1)
+        self._lock = threading.Lock()
+
+    def record( self, event:str, build:SimpleNamespace | None = None, **fields ):
+        """Write an event of the runner, for a build if one is given."""
+        context = {'project': build.project.name, 'build': build.name} if build else {}
+        self._write({'event': event, 'time': time.time(), **context, **fields})
+
+    @contextmanager
+    def span( self, name:str, **fields ):
+        """Record ``<name>_start`` and ``<name>_end`` around a block, the end with its duration."""
+        start = time.monotonic()
+        self.record(f'{name}_start', **fields)
+        try: yield
+        finally: self.record(f'{name}_end', duration=time.monotonic() - start, **fields)
+
+    def _write( self, record:dict ):
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    @staticmethod
+    def channel_path( build:SimpleNamespace ) -> Path:
+        return build.project.path / 'logs-raw' / f'{build.name}.events.jsonl'
+
+    def channel( self, build:SimpleNamespace ) -> dict[str, str]:
+        """Start an empty channel for a build script, and return the environment that points it there."""
+        path = self.channel_path(build)
+        path.write_text('', encoding='utf-8')
+        return {EVENTS_ENV: str(path)}
+
+    def collect( self, build:SimpleNamespace ) -> list[dict]:
+        """Move the events a build script emitted into the run's log, and return them."""
+        events = read_events(self.channel_path(build))
+        for event in events:
+            self._write({'project': build.project.name, 'build': build.name, **event})
+        return events
+
+    def close(self):
+        self._file.close()
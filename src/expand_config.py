@@ -7,10 +7,12 @@ of multiple configuration permutations that can be used in build systems or
 toolchain-based workflows.
 """
 import itertools
-from copy import deepcopy
+import re
 from types import SimpleNamespace
+from typing import Callable
 
 from src.config import gopts
+from src.layer import ConfigLayer
 from share.snippets import cmake_build, cmake_check, cmake_configure
 
 
@@ -41,10 +43,37 @@ def expand_func( configs_in:list[SimpleNamespace], func, *args ) -> list:
     return configs_out
 
 
+def prune_by_name( configs_in:list[SimpleNamespace], name_func:Callable[..., str], **remaining:list ) -> list:
+    """
+    Drops partially expanded configurations whose final name can no longer match ``--build-regex``.
+
+    Filtering after expansion builds the whole matrix just to throw most of it away.
+    Called between expansion stages, this enumerates only the name parts that are not
+    expanded yet, which is cheap string work, and keeps a configuration if any
+    combination of them gives a matching name. Expansions that later skip a value
+    only ever narrow that set, so nothing that would have matched is lost. It pays off
+    ahead of a large fan-out, a small matrix can just as well be filtered afterwards.
+
+    :param configs_in: The configurations expanded so far.
+    :param name_func: Builds the final name from a configuration, with keyword arguments
+        supplying the values of the dimensions that are not expanded yet.
+    :param remaining: For each dimension still to be expanded, the values it can take.
+    :return: The configurations that can still produce a matching name.
+    :rtype: list
+    """
+    pattern = re.compile(gopts.build_regex)
+    if pattern.pattern in ('', '.*'): return configs_in
+
+    keys = list(remaining.keys())
+    combinations = list(itertools.product(*remaining.values()))
+    return [cfg for cfg in configs_in
+            if any(pattern.search(name_func(cfg, **dict(zip(keys, values)))) for values in combinations)]
+
+
 def expand_list( configs_in:list[SimpleNamespace], prop:str, items:list ) -> list:
     """
     Expands a list of configuration objects by associating each configuration with
-    each item in a given list. A deep copy of each configuration is made, and the
+    each item in a given list. Each configuration gets a copy-on-write layer, and the
     specified property is updated with the corresponding item.
 
     :param configs_in: A list of SimpleNamespace objects representing the initial
@@ -59,9 +88,9 @@ def expand_list( configs_in:list[SimpleNamespace], prop:str, items:list ) -> lis
     """
     configs_out:list = []
     for cfg, item in itertools.product(configs_in, items):
-        cfg = deepcopy(cfg)
-        setattr(cfg, prop, item )
-        configs_out.append( cfg )
+        cfg_out = ConfigLayer(cfg)
+        setattr(cfg_out, prop, item )
+        configs_out.append( cfg_out )
     return configs_out
 
 def expand_attr_list( config_in:SimpleNamespace, attr:str, items:list[SimpleNamespace] ) -> list:
@@ -69,8 +98,8 @@ def expand_attr_list( config_in:SimpleNamespace, attr:str, items:list[SimpleName
     Expands a configuration attribute based on provided items and returns a list of expanded configurations.
 
     This function takes an initial configuration, a specified attribute, and a list of items.
-    For each item in the list, it creates a copy of the initial configuration and assigns the
-    respective item to the given attribute. If an item has specific methods (`configure` or
+    For each item in the list, it layers over the initial configuration and assigns a layer over
+    the respective item to the given attribute. If an item has specific methods (`configure` or
     `expand`), the function further processes these cases to create more granular configurations.
     The method recursively expands configurations as necessary.
 
@@ -86,9 +115,9 @@ def expand_attr_list( config_in:SimpleNamespace, attr:str, items:list[SimpleName
     configs_out:list[SimpleNamespace] = []
 
     for item in items:
-        cfg = deepcopy(config_in)
+        cfg = ConfigLayer(config_in)
 
-        setattr(cfg, attr, deepcopy(item) )
+        setattr(cfg, attr, ConfigLayer(item) if isinstance(item, SimpleNamespace) else item )
 
         if hasattr( item, 'configure' ):
             cfg.configure_funcs.append( getattr(item, 'configure') )
@@ -104,7 +133,7 @@ def expand_attr_list( config_in:SimpleNamespace, attr:str, items:list[SimpleName
 def expand_buildtools( config_in:SimpleNamespace, project:SimpleNamespace ) -> list:
     """
     Performs the expansion of build tools by iterating over the `buildtools` of the provided
-    project and copying the incoming base configuration for each tool. Expansions and
+    project and layering over the incoming base configuration for each tool. Expansions and
     configurations for each build tool are added to the output list of configurations.
 
     :param config_in: The base configuration that is copied and extended for each build tool.
@@ -116,10 +145,10 @@ def expand_buildtools( config_in:SimpleNamespace, project:SimpleNamespace ) -> l
     """
     configs_out:list = []
     for tool in project.buildtools.keys():
-        cfg = deepcopy(config_in)
+        cfg = ConfigLayer(config_in)
 
         buildtool : SimpleNamespace = project.buildtools[tool]
-        setattr(cfg, 'buildtool', buildtool)
+        setattr(cfg, 'buildtool', ConfigLayer(buildtool))
 
         if hasattr( buildtool, 'configure' ):
             cfg.configure_funcs.append(buildtool.configure)
@@ -154,18 +183,18 @@ def expand_toolchains( cfg:SimpleNamespace, project:SimpleNamespace ) -> list:
 
         # The toolchain itself might have an expander function for variations.
         if hasattr(toolchain, 'expand'):
-            cfg = deepcopy(cfg)
-            setattr(cfg, 'toolchain', toolchain )
-            configs_out += expand_func([cfg], getattr(toolchain, 'expand'))
+            cfg_out = ConfigLayer(cfg)
+            setattr(cfg_out, 'toolchain', toolchain )
+            configs_out += expand_func([cfg_out], getattr(toolchain, 'expand'))
             continue
 
         # else
         for arch, platform in itertools.product(toolchain.arch, toolchain.platform):
-            cfg = deepcopy(cfg)
-            setattr(cfg, 'toolchain', toolchain )
-            setattr(cfg, 'arch', arch )
-            setattr(cfg, 'platform', platform )
-            configs_out.append( cfg )
+            cfg_out = ConfigLayer(cfg)
+            setattr(cfg_out, 'toolchain', toolchain )
+            setattr(cfg_out, 'arch', arch )
+            setattr(cfg_out, 'platform', platform )
+            configs_out.append( cfg_out )
 
     return configs_out
 
@@ -209,7 +238,7 @@ def expand_cmake( config:SimpleNamespace ) -> list:
                 # skip visual studio generator with toolchains that are not msvc
                 if toolchain.name != generator_key: continue
 
-        cfg = deepcopy(config)
+        cfg = ConfigLayer(config)
         cmake = cfg.buildtool
 
         # Now we have selected these items, we dont need their options lists on the copied objects.
@@ -1,5 +1,6 @@
 import os
 import re
+import sys
 import typing
 from copy import deepcopy
 from dataclasses import dataclass
@@ -249,6 +250,10 @@ class Section:
         Section.last_index = self.idx
 
         toc[self] = {}
+        # Build scripts mark their sections for the runner's log index, see src/build_log.py
+        if os.environ.get('AUTOBUILD_SECTION_MARKERS'):
+            sys.stdout.write(f"section: {self.name}\n")
+            sys.stdout.flush()
         self.print('start')
 
         Section._breadcrumbs.append(self)
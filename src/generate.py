@@ -13,13 +13,37 @@ to scripts, defining custom JSON encoding, and generating build scripts for
 projects based on their configurations.
 """
 import inspect
+import io
 import json
+from functools import cache
 from json import JSONEncoder
 from types import SimpleNamespace
 from typing import IO
 
 from share import script_preamble
 from share.script_preamble import *
+from src.git_utils import resolve_build_commit
+
+# Options that shape this run but not what a build produces. They reach the build
+# scripts through RUN_OPTIONS_ENV instead of being written into them, so a different
+# command line neither rewrites the scripts nor changes the builds' fingerprints.
+RUN_OPTIONS = [
+    'command', 'jobs', 'parallel', 'runner', 'force', 'verbose', 'quiet', 'debug',
+    'list', 'show', 'stats_history', 'regression', 'trace', 'no_cache',
+    'log_history', 'log_section', 'log_run', 'log_raw',
+    'mem_headroom', 'mem_per_job', 'timeout', 'timeout_factor', 'idle_timeout',
+    'fetch_jobs', 'offline', 'ls_remote_ttl', 'no_object_store',
+    'toolchain_regex', 'project_regex', 'build_regex',
+    'toolchain_actions', 'project_actions', 'actions',
+]
+RUN_OPTIONS_ENV = 'AUTOBUILD_RUN_OPTS'
+# What a script run by hand, without RUN_OPTIONS_ENV, assumes.
+_RUN_DEFAULTS = {'verbose': False, 'quiet': False, 'debug': False, 'jobs': 1}
+
+
+def run_options( opts:SimpleNamespace ) -> str:
+    """The RUN_OPTIONS of this run as JSON, for RUN_OPTIONS_ENV."""
+    return json.dumps( {key: getattr(opts, key) for key in RUN_OPTIONS if hasattr(opts, key)}, default=str )
 
 class MyEncoder(JSONEncoder):
     """
@@ -51,9 +75,15 @@ class MyEncoder(JSONEncoder):
 
 json.JSONEncoder = MyEncoder
 
+# Rendered script parts by function, the same few parts are shared by hundreds of builds.
+_script_part_cache:dict = {}
+
 def func_to_string( func ) -> str:
     """Convert a function's source code to a string, skipping specified lines.
 
+    The result is cached per function, bound methods share the entry of the
+    function they wrap.
+
     Args:
         func (callable): The function to convert.
 
@@ -61,6 +91,13 @@ def func_to_string( func ) -> str:
         str: The function's source code, excluding lines before '# start_script' if present.
     """
     if func is None: return ''
+    func = getattr(func, '__func__', func)
+    if func not in _script_part_cache:
+        _script_part_cache[func] = _render_script_part(func)
+    return _script_part_cache[func]
+
+def _render_script_part( func ) -> str:
+    """Read a function's source, keeping only what follows '# start_script'."""
     lines:list = ['']
     skip = True
     source = inspect.getsource( func )
@@ -135,6 +172,13 @@ def write_preamble(buffer:IO):
     Returns:
         None: Writes the preamble to the buffer.
     """
+    # TODO add checking for required modules and bail nicely.
+    buffer.write( _preamble_source() )
+
+
+@cache
+def _preamble_source() -> str:
+    """Read share/script_preamble.py once, every build script starts with the same preamble."""
     from src.config import gopts
     lines = [
         "#!/bin/env python",
@@ -142,10 +186,7 @@ def write_preamble(buffer:IO):
         f"sys.path.append({repr(str(gopts.path))})"]
     with open(Path(script_preamble.__file__)) as preamble:
         lines += preamble.read().splitlines()
-
-    # TODO add checking for required modules and bail nicely.
-    buffer.write( '\n'.join( lines ) )
-    buffer.write('\n\n')
+    return '\n'.join( lines ) + '\n\n'
 
 
 def write_section( buffer:IO, section:SimpleNamespace, section_name:str ):
@@ -171,9 +212,44 @@ def write_section( buffer:IO, section:SimpleNamespace, section_name:str ):
 # │                                                    |_|                     │
 # ╰────────────────────────────────────────────────────────────────────────────╯
 
+def render_build_script( opts:SimpleNamespace, project:SimpleNamespace, build:SimpleNamespace ) -> str:
+    """Render the build script for a build configuration in memory.
+
+    Args:
+        opts (SimpleNamespace): Configuration options.
+        project (SimpleNamespace): The project the build belongs to.
+        build (SimpleNamespace): The build configuration.
+
+    Returns:
+        str: The source of the build script.
+    """
+    script = io.StringIO()
+    write_preamble(script)
+    build_opts = SimpleNamespace( **{k: v for k, v in vars(opts).items() if k not in RUN_OPTIONS} )
+    write_section( script, build_opts, 'opts' )
+    script.write("import json\n")
+    script.write(f"opts |= {_RUN_DEFAULTS!r} | json.loads(os.environ.get({RUN_OPTIONS_ENV!r}, '{{}}'))\n")
+    # The scheduler hands each build its share of the job budget.
+    script.write("opts['jobs'] = int(os.environ.get('AUTOBUILD_JOBS', opts['jobs']))\n\n")
+    write_section( script, project, 'project' )
+    script.write("os.chdir(str(project['path']))\n\n")
+    write_section( script, build, 'build' )
+    write_section( script, build.source_def, 'source' )
+    write_section( script, build.toolchain, 'toolchain' )
+    write_section( script, build.buildtool, 'buildtool' )
+
+    for section in [opts, build.toolchain, project, build]:
+        for part in getattr( section, f'script_parts', [] ):
+            script.write( func_to_string( part ) )
+    return script.getvalue()
+
+
 def generate_build_scripts( opts:SimpleNamespace ):
     """Generate Python build scripts for each project configuration.
 
+    Scripts are rendered in memory and only written when their content changed,
+    so an unchanged script keeps its mtime.
+
     Args:
         opts (SimpleNamespace): Configuration options with project definitions.
 
@@ -181,21 +257,26 @@ def generate_build_scripts( opts:SimpleNamespace ):
         None: Writes build scripts to disk for each build configuration.
     """
     projects = opts.projects
+    # The commit each worktree is to be at, resolved once per worktree, lets
+    # source_git skip a worktree that is already there without running git.
+    targets:dict = {}
     for project in projects.values():
         fmt.h(f'{project.name}')
+        written = 0
         for build in project.build_configs.values():
+            if 'source' in opts.build_actions and 'source' in getattr(build, 'verbs', []):
+                if build.source_path not in targets:
+                    targets[build.source_path] = resolve_build_commit( opts, build )
+                build.source_commit = targets[build.source_path]
+            source = render_build_script( opts, project, build )
+            try:
+                if build.script_path.read_text( encoding='utf-8' ) == source: continue
+            except (OSError, UnicodeDecodeError):
+                pass
             with open( build.script_path, "w", encoding='utf-8' ) as script:
-                write_preamble(script)
-                write_section( script, opts, 'opts' )
-                write_section( script, project, 'project' )
-                script.write("os.chdir(str(project['path']))\n\n")
-                write_section( script, build, 'build' )
-                write_section( script, build.source_def, 'source' )
-                write_section( script, build.toolchain, 'toolchain' )
-                write_section( script, build.buildtool, 'buildtool' )
-
-                for section in [opts, build.toolchain, project, build]:
-                    for part in getattr( section, f'script_parts', [] ):
-                        script.write( func_to_string( part ) )
+                script.write( source )
+            written += 1
+        if opts.verbose:
+            fmt.hu(f'{written} written, {len(project.build_configs) - written} unchanged')
 
 
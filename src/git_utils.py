@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 """Git utilities for source fetching and overrides."""
-import os
+import hashlib
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 from types import SimpleNamespace
 
@@ -19,11 +22,13 @@ from rich.progress import (
 from src import format as fmt
 from src.ConsoleMultiplex import ConsoleMultiplex
 from src.error import handle_error
+from src.events import EventLog
+from src.remote_refs import RemoteRefCache
 
 import re
 
 import git
-from git import GitCommandError, Repo, RemoteProgress
+from git import GitCommandError, Repo, RemoteProgress, SymbolicReference, InvalidGitRepositoryError, NoSuchPathError
 
 console = ConsoleMultiplex()
 
@@ -129,26 +134,33 @@ def _make_fetch_progress() -> Progress:
 def _git_fetch_with_retry(repo: Repo, remote_name: str, refspec, opts,
                           max_attempts: int = 4,
                           initial_delay: float = 3.0,
-                          backoff: float = 2.0):
+                          backoff: float = 2.0,
+                          progress: Progress | None = None,
+                          label: str | None = None,
+                          **options):
     """Run a fetch with a live Rich progress display and retry on transient errors.
 
     If `refspec` is None or empty, the remote's *configured* fetch refspec is
     used — this is the desired default so that branches land under
     refs/remotes/<name>/* rather than clobbering refs/*.
+
+    Concurrent fetches pass a shared `progress`, and a `label` naming the repo,
+    otherwise each attempt gets a display of its own. Any other `options`, like
+    `depth` or `deepen`, are passed on to git fetch.
     """
     remote = repo.remote(remote_name)
     delay = initial_delay
+    label = label or remote_name
 
     for attempt in range(1, max_attempts + 1):
         try:
-            with _make_fetch_progress() as progress:
-                label = remote_name if attempt == 1 else f'{remote_name} (retry {attempt - 1})'
-                bridge = _RichFetchProgress(progress, label=label)
+            with nullcontext(progress) if progress else _make_fetch_progress() as display:
+                bridge = _RichFetchProgress(display, label=label if attempt == 1 else f'{label} (retry {attempt - 1})')
                 # tags=False: incremental branch updates do not need to re-walk
                 # every tag (Godot has hundreds); that flood of stderr lines was
                 # also a major source of "stuck in a thread" feel under Rich.
                 # Initial clone still uses tags=True.
-                fetch_kwargs = dict(progress=bridge, tags=False, force=True, verbose=True)
+                fetch_kwargs = dict(progress=bridge, tags=False, force=True, verbose=True, **options)
                 # Only pass refspec if the caller supplied one; otherwise use
                 # the remote's configured refspec (much better default).
                 if refspec:
@@ -174,14 +186,11 @@ def _git_fetch_with_retry(repo: Repo, remote_name: str, refspec, opts,
 
 
 #MARK: Override
-def git_override(opts: SimpleNamespace):
+def git_override(opts: SimpleNamespace, remote_refs: RemoteRefCache | None = None):
     """Add ONE transient source definition (copied from 'origin') when --giturl/--gitref is used."""
-    commit_hash = ""
-    from git import GitCommandError
-    import git
     from copy import deepcopy
 
-    g = git.cmd.Git()
+    remote_refs = remote_refs or RemoteRefCache(opts)
 
     for project in opts.projects.values():
         if 'origin' not in getattr(project, 'sources', {}):
@@ -199,13 +208,8 @@ def git_override(opts: SimpleNamespace):
         if gitdef.get('remote'):
             override_src.remote = gitdef.get('remote', 'origin')
 
-        try:
-            fmt.h(f"git ls-remote {override_src.url} {override_src.ref}")
-            response = g.ls_remote(override_src.url, override_src.ref)
-            commit_hash = response.split()[0] if response else None
-        except GitCommandError as e:
-            if not handle_error(f"git ls-remote {override_src.url} {override_src.ref}", e, opts):
-                commit_hash = None
+        fmt.h(f"git ls-remote {override_src.url} {override_src.ref}")
+        commit_hash = remote_refs.resolve(override_src.url, override_src.ref)
 
         if commit_hash:
             fmt.hu(commit_hash)
@@ -214,26 +218,112 @@ def git_override(opts: SimpleNamespace):
             break
 
 
+#MARK: ObjectStore
+class ObjectStore:
+    """A bare repository holding the objects of every git URL fetched on this machine.
+
+    Before a project's bare repo is cloned or fetched, the same branches are
+    fetched into the store, and the project repo borrows the store's objects
+    through ``objects/info/alternates``, so each object is downloaded and kept
+    once, however many projects or submodules share the history. Each URL is a
+    remote of the store named by its hash, without tags, as those would clash.
+
+    The project repos need every object the store has handed out, so the store
+    never prunes, and deleting it breaks them.
+    """
+
+    def __init__(self, path: Path, opts: SimpleNamespace):
+        self.path = path
+        self.opts = opts
+        self._lock = threading.Lock()
+        self._url_locks: dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def remote_name(url: str) -> str:
+        return 'url-' + hashlib.sha1(url.rstrip('/').encode()).hexdigest()[:12]
+
+    def _remote(self, url: str) -> str:
+        """Create the store, and the URL's remote in it, when they don't exist yet."""
+        name = self.remote_name(url)
+        with self._lock:
+            if not self.path.exists():
+                repo = Repo.init(self.path, bare=True, mkdir=True)
+                with repo.config_writer() as cw:
+                    cw.set_value('gc', 'auto', 0)
+                    cw.set_value('gc', 'pruneExpire', 'never')
+            repo = Repo(self.path)
+            self._url_locks.setdefault(name, threading.Lock())
+            if name not in [remote.name for remote in repo.remotes]:
+                remote = repo.create_remote(name, url)
+                with remote.config_writer as cw:
+                    cw.set('fetch', f'+refs/heads/*:refs/remotes/{name}/*')
+                    cw.set('tagopt', '--no-tags')
+        return name
+
+    def fetch(self, url: str, refs: set[str] | None, progress: Progress | None = None, label: str = ''):
+        """Fetch branches of a URL into the store, all of them when ``refs`` is None."""
+        name = self._remote(url)
+        refspecs = [f'+refs/heads/{ref}:refs/remotes/{name}/{ref}' for ref in sorted(refs)] if refs else None
+        # Projects sharing a URL take turns, the later ones find the objects there.
+        with self._url_locks[name]:
+            _git_fetch_with_retry(Repo(self.path), name, refspecs, self.opts, progress=progress, label=f'{label} (store)')
+
+    def borrow(self, gitdir: Path):
+        """Let an existing repository use the store's objects."""
+        alternates = gitdir / 'objects' / 'info' / 'alternates'
+        store_objects = (self.path / 'objects').resolve().as_posix()
+        lines = alternates.read_text(encoding='utf-8').splitlines() if alternates.exists() else []
+        if store_objects in lines: return
+        alternates.parent.mkdir(parents=True, exist_ok=True)
+        alternates.write_text('\n'.join(lines + [store_objects]) + '\n', encoding='utf-8')
+
+
 #MARK: Fetch
-def git_fetch_project(opts: SimpleNamespace, project: SimpleNamespace):
-    """Handle git fetch/prune/add-remote/ls-remote/rev-parse for project builds/sources."""
+def git_fetch_project(opts: SimpleNamespace, project: SimpleNamespace, remote_refs: RemoteRefCache | None = None,
+                      fetch_pool: ThreadPoolExecutor | None = None, progress: Progress | None = None,
+                      store: ObjectStore | None = None):
+    """Handle git fetch/prune/add-remote/ls-remote/rev-parse for project builds/sources.
+
+    Remote refs are looked up in ``remote_refs``, shared between projects, or a cache of its own.
+    Given a ``fetch_pool``, the clone and the fetch of each remote run in it, side by side,
+    showing in the shared ``progress``, see git_fetch_projects. Given a ``store``, objects
+    are downloaded into it first and the project repo borrows them.
+    """
     if opts.dry:
         fmt.h("Dry-Run: Skipping Fetch")
         return
-
-    os.chdir(project.path)
+    remote_refs = remote_refs or RemoteRefCache(opts)
 
     srcdef_for_clone = project.sources.get('origin') or next(iter(project.sources.values()))
     gitdir = project.path / getattr(srcdef_for_clone, 'gitdir', Path('git'))
+    # A partial or shallow clone is the quick start, the store would download everything.
+    options = clone_options(srcdef_for_clone)
+    if options: store = None
 
     # Ensure git repo exists, and is clean
     if not gitdir.exists():
-        fmt.h('Cloning Repository')
-        repo = git.Repo.clone_from(srcdef_for_clone.url, gitdir, progress=print, bare=True, tags=True)
-        #FIXME the clone doesnt use the progress bars we setup for fetching.
+        if opts.offline:
+            fmt.h(f"[yellow]Offline: no repository to build from at {gitdir}[/yellow]")
+            return
+        fmt.h(f'Cloning Repository: {project.name}')
+        def clone() -> Repo:
+            clone_progress = _RichFetchProgress(progress, label=f'{project.name} clone') if progress else print
+            if not store:
+                # Tags would drag in their own history past a shallow clone's depth.
+                return git.Repo.clone_from(srcdef_for_clone.url, gitdir, progress=clone_progress, bare=True,
+                                           tags='depth' not in options, **options)
+            # --reference only downloads what the store doesn't have, the tags.
+            store.fetch(srcdef_for_clone.url, None, progress, f'{project.name} clone')
+            return git.Repo.clone_from(srcdef_for_clone.url, gitdir, progress=clone_progress, bare=True, tags=True,
+                                       reference=store.path.as_posix())
+        repo = fetch_pool.submit(clone).result() if fetch_pool else clone()
     else:
         repo = git.Repo(gitdir)
+        if store: store.borrow(gitdir)
         prune_worktrees(opts, repo)
+    shallow = (gitdir / 'shallow').exists()
+    # Every ref lookup below is answered from one for-each-ref.
+    index = RefIndex(repo)
 
     # print remotes
     if opts.verbose:
@@ -246,13 +336,17 @@ def git_fetch_project(opts: SimpleNamespace, project: SimpleNamespace):
         console.print(table)
 
     # update
-    fmt.h("Looking for Updates")
+    fmt.h(f"Looking for Updates: {project.name}")
     if opts.verbose: fmt.hu()
 
     # remote name -> set of branch names that need a fetch
     fetch_list: dict[str, set[str]] = {}
-    # cache remote hashes so we only ls-remote once per (url, ref)
-    remote_hash_cache: dict[tuple[str, str], str | None] = {}
+    # remote name -> commits a shallow repo has to be deepened to reach
+    deepen_list: dict[str, set[str]] = {}
+    # remote name -> the depth its new branches are fetched with, in a shallow repo
+    depths: dict[str, int] = {}
+    # remote name -> the branches the builds use, which deepening extends
+    branches: dict[str, set[str]] = {}
 
     # Accept full SHA1 or common short hashes (4+ hex chars)
     sha_re = re.compile(r'^[0-9a-f]{4,40}$', re.I)
@@ -263,6 +357,8 @@ def git_fetch_project(opts: SimpleNamespace, project: SimpleNamespace):
         # derive the final source definition by merging the generated config with the cmdline override.
         gitdef: SimpleNamespace = SimpleNamespace(
             {**vars(build.source_def), **vars(getattr(opts, 'srcdef', SimpleNamespace()))})
+        if shallow: depths[gitdef.remote] = getattr(gitdef, 'depth', None) or depths.get(gitdef.remote, 1)
+        if not sha_re.match(gitdef.ref): branches.setdefault(gitdef.remote, set()).add(gitdef.ref)
 
         # Add the new remote to the bare repo if it doesnt exist, and queue a fetch
         if gitdef.remote not in [remote.name for remote in repo.remotes]:
@@ -270,17 +366,23 @@ def git_fetch_project(opts: SimpleNamespace, project: SimpleNamespace):
             fetch_list.setdefault(gitdef.remote, set()).add(gitdef.ref)
             continue
 
+        # A commit the build is pinned to, by its ref or by an override.
+        commit = gitdef.ref if sha_re.match(gitdef.ref) else getattr(gitdef, 'resolved_commit', None)
+
+        # A shallow repo may just not go back far enough yet.
+        if commit and shallow and not has_commit(repo, commit, index):
+            fmt.hu(f"commit not reachable yet: {gitdef.remote} {commit[:8]}")
+            deepen_list.setdefault(gitdef.remote, set()).add(commit)
+            if commit == gitdef.ref: continue
+
         # If we are being passed a commit hash, full or short, continue if it exists.
-        if sha_re.match(gitdef.ref) and resolve_local_ref(repo, gitdef.ref):
+        if sha_re.match(gitdef.ref) and resolve_local_ref(repo, gitdef.ref, index):
             if opts.verbose:
                 fmt.hu(f"  - Fixed commit [green]{gitdef.ref[:8]}[/green]... available locally ✓")
             continue
 
         # get the remote hash for the ref we want. or disable the build if it does not exist
-        cache_key = (gitdef.url, gitdef.ref)
-        if cache_key not in remote_hash_cache:
-            remote_hash_cache[cache_key] = resolve_remote_ref(gitdef.url, gitdef.ref, opts)
-        remote_hash = remote_hash_cache[cache_key]
+        remote_hash = resolve_remote_ref(gitdef.url, gitdef.ref, opts, remote_refs)
         if not remote_hash:
             fmt.hu(f"disabling build: '{build.name}'")
             build.disabled = True
@@ -295,7 +397,7 @@ def git_fetch_project(opts: SimpleNamespace, project: SimpleNamespace):
         # for origin falsely reported "not available" and triggered a full
         # +refs/heads/*:refs/heads/* fetch of every Godot branch (hangs for a
         # long time in GitPython's output-pump thread).
-        local_hash = resolve_local_tracking_ref(repo, gitdef.remote, gitdef.ref)
+        local_hash = resolve_local_tracking_ref(repo, gitdef.remote, gitdef.ref, index)
         if not local_hash:
             fmt.hu(f"local ref not yet available: {gitdef.remote}/{gitdef.ref}")
             fetch_list.setdefault(gitdef.remote, set()).add(gitdef.ref)
@@ -311,9 +413,30 @@ def git_fetch_project(opts: SimpleNamespace, project: SimpleNamespace):
 
     fmt.hd()
 
-    if fetch_list:
-        fmt.h("Fetching updates:")
-        for remote, refs in fetch_list.items():
+    if (fetch_list or deepen_list) and opts.offline:
+        fmt.h(f"[yellow]Offline: not fetching {', '.join(sorted(fetch_list | deepen_list))}[/yellow]")
+        return
+    def fetch(remote: str, refs: set[str], refspecs: list[str], commits: set[str]):
+        label = f'{project.name}/{remote}'
+        try:
+            if refspecs:
+                # With the objects in the store the project's fetch only updates its refs.
+                if store: store.fetch(repo.remote(remote).url, refs, progress, label)
+                # New branches of a shallow repo come with as much history as the clone had.
+                depth = {'depth': depths[remote]} if shallow and remote in depths else {}
+                _git_fetch_with_retry(repo, remote, refspecs, opts, progress=progress, label=label, **depth)
+            if commits:
+                deepen_to(repo, remote, branches.get(remote, set()), commits, opts, depths.get(remote, 1),
+                          progress, label, index)
+        except GitCommandError as e:
+            handle_error(f"git fetch {project.name}/{remote}", e, opts)
+
+    if fetch_list or deepen_list:
+        fmt.h(f"Fetching updates: {project.name}")
+        futures = []
+        for remote in fetch_list | deepen_list:
+            refs = fetch_list.get(remote, set())
+            commits = deepen_list.get(remote, set())
             # Fetch only the branches we need into the remote-tracking
             # namespace (matches add_remote / bare-clone fetch config).
             # Avoids the previous origin special-case that pulled every
@@ -322,12 +445,38 @@ def git_fetch_project(opts: SimpleNamespace, project: SimpleNamespace):
                 f"+refs/heads/{ref}:refs/remotes/{remote}/{ref}"
                 for ref in sorted(refs)
             ]
-            fmt.hu(f'git fetch --progress --force {remote} {" ".join(refspecs)}')
-            try:
-                _git_fetch_with_retry(repo, remote, refspecs, opts)
-            except GitCommandError as e:
-                handle_error(f"git fetch {remote}", e, opts)
-    fmt.h("[green]Up-To-Date")
+            if refspecs: fmt.hu(f'git fetch --progress --force {remote} {" ".join(refspecs)}')
+            # The remotes of a repo fetch side by side, each into its own refs.
+            if fetch_pool: futures.append(fetch_pool.submit(fetch, remote, refs, refspecs, commits))
+            else: fetch(remote, refs, refspecs, commits)
+        for future in futures: future.result()
+    fmt.h(f"[green]Up-To-Date: {project.name}")
+
+
+def git_fetch_projects(opts: SimpleNamespace, projects: dict[str, SimpleNamespace],
+                       remote_refs: RemoteRefCache | None = None, events: EventLog | None = None):
+    """Fetch every project at once.
+
+    Each project is checked in a thread of its own, while the clones and the
+    fetches of every remote share a pool of ``opts.fetch_jobs`` threads, so at most
+    that many transfers run at once, each with its own bars in one progress display.
+    A fetch takes about as long as the slowest repository instead of all of them.
+    Objects are shared through the ObjectStore at ``opts.object_store``, unless it is None.
+    """
+    remote_refs = remote_refs or RemoteRefCache(opts)
+    store = ObjectStore(opts.object_store, opts) if opts.object_store else None
+
+    def fetch_project(project: SimpleNamespace):
+        with events.span('fetch', project=project.name) if events else nullcontext():
+            git_fetch_project(opts, project, remote_refs, fetch_pool, progress, store)
+
+    with (
+        _make_fetch_progress() as progress,
+        ThreadPoolExecutor(max(1, opts.fetch_jobs), thread_name_prefix='fetch') as fetch_pool,
+        ThreadPoolExecutor(max(1, len(projects)), thread_name_prefix='fetch-project') as project_pool,
+    ):
+        futures = [project_pool.submit(fetch_project, project) for project in projects.values()]
+        for future in futures: future.result()
 
 
 #MARK: Prune
@@ -374,44 +523,124 @@ def add_remote(repo: Repo, gitdef, opts):
         cw.set('fetch', f'+refs/heads/*:refs/remotes/{gitdef.remote}/*')
         # Also grab tags automatically (equivalent to `git remote add --tags`)
         cw.set('tagopt', '--tags')
+        # A partial clone's other remotes leave out the same objects.
+        if getattr(gitdef, 'filter', None):
+            cw.set('promisor', 'true')
+            cw.set('partialclonefilter', gitdef.filter)
 
 
 #MARK: ResolveRemote
-def resolve_remote_ref(url, ref, opts):
+def resolve_remote_ref(url, ref, opts, remote_refs: RemoteRefCache | None = None):
     """
     Resolve the remote commit hash for a named ref.
     Returns the hash if the remote advertises the ref, otherwise None.
+    The answer comes from the URL's cached ref listing, see RemoteRefCache.
     """
-    g = git.cmd.Git()
-    try:
-        ls_args = ['--exit-code', url, ref]
-        if opts.verbose:
-            fmt.h(f"git ls-remote {' '.join(ls_args)}")
-        response = g.ls_remote(ls_args)
-        if not response:
-            fmt.hu(f"git ls-remote returned '{response}'")
-            if getattr(opts, 'gitoverride', False):
-                exit(1)
-            return None
-
-        remote_hash = response.split()[0]
-        if opts.verbose:
-            fmt.hu(remote_hash)
-        return remote_hash
-    except GitCommandError as e:
-        handle_error(f"git ls-remote --exit-code {url} {ref}", e, opts)
+    remote_refs = remote_refs or RemoteRefCache(opts)
+    remote_hash = remote_refs.resolve(url, ref)
+    if not remote_hash:
+        fmt.hu(f"git ls-remote {url} {ref}: not advertised")
+        if getattr(opts, 'gitoverride', False):
+            exit(1)
         return None
+    if opts.verbose:
+        fmt.hu(remote_hash)
+    return remote_hash
+
+
+#MARK: Shallow
+def clone_options(gitdef: SimpleNamespace) -> dict:
+    """The git clone options of a source's ``filter`` and ``depth``, for a partial or shallow clone."""
+    options = {}
+    if getattr(gitdef, 'filter', None):
+        options['filter'] = gitdef.filter
+    if getattr(gitdef, 'depth', None):
+        # Keep every branch, like a full bare clone does.
+        options |= {'depth': gitdef.depth, 'no_single_branch': True}
+    return options
+
+
+def has_commit(repo: Repo, commit: str, index: 'RefIndex | None' = None) -> bool:
+    """Whether the repo has a commit, rev-parse alone hands back any full hash it is given."""
+    return (index or RefIndex(repo)).object(f'{commit}^{{commit}}') is not None
+
+
+def deepen_to(repo: Repo, remote: str, refs: set[str], commits: set[str], opts, step: int,
+              progress: Progress | None = None, label: str | None = None, index: 'RefIndex | None' = None) -> bool:
+    """Deepen a shallow repo's history from a remote until it reaches the commits.
+
+    Each round fetches ``step`` more commits of the remote's branches in ``refs``,
+    or of its HEAD without any, doubling the step each time, and stops once the
+    repo is no longer shallow.
+    """
+    refspecs = [f"+refs/heads/{ref}:refs/remotes/{remote}/{ref}" for ref in sorted(refs)] or ['HEAD']
+    index = index or RefIndex(repo)
+    missing = {commit for commit in commits if not has_commit(repo, commit, index)}
+    while missing:
+        if not (Path(repo.git_dir) / 'shallow').exists():
+            fmt.hu(f"[yellow]{remote}: full history fetched, {', '.join(c[:8] for c in missing)} not found[/yellow]")
+            return False
+        fmt.hu(f"deepening {remote} by {step} commits to reach {', '.join(c[:8] for c in missing)}")
+        _git_fetch_with_retry(repo, remote, refspecs, opts, progress=progress, label=f'{label or remote} deepen', deepen=step)
+        missing = {commit for commit in missing if not has_commit(repo, commit, index)}
+        step *= 2
+    return True
+
+
+#MARK: RefIndex
+class RefIndex:
+    """Every ref of a repository, read with a single ``git for-each-ref``.
+
+    Answers the lookups that would each start a ``git rev-parse``, in the order
+    rev-parse tries names in. Abbreviated hashes and other revisions go to the one
+    ``git cat-file --batch-check`` process GitPython keeps running for the repo.
+    Refs are read on first use and again after :meth:`invalidate`, as a fetch moves them.
+    Safe to share between threads.
+    """
+    # How git expands a short name, see gitrevisions(7).
+    _RULES = ('{}', 'refs/{}', 'refs/tags/{}', 'refs/heads/{}', 'refs/remotes/{}', 'refs/remotes/{}/HEAD')
+
+    def __init__(self, repo: Repo):
+        self.repo = repo
+        self._refs: dict[str, str] | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def refs(self) -> dict[str, str]:
+        """Commit, or tag object, hash by full ref name, HEAD included."""
+        with self._lock:
+            if self._refs is None:
+                listing = self.repo.git.for_each_ref('--format=%(objectname) %(refname)')
+                self._refs = {name: sha for sha, _, name in (line.partition(' ') for line in listing.splitlines())}
+                if head := read_ref(self.repo, 'HEAD'): self._refs['HEAD'] = head
+            return self._refs
+
+    def invalidate(self):
+        with self._lock: self._refs = None
+
+    def object(self, rev: str) -> str | None:
+        """The hash of an object the repo has, None when it hasn't or ``rev`` is ambiguous."""
+        with self._lock:
+            try: return self.repo.git.get_object_header(rev)[0].decode('ascii')
+            except ValueError: return None
+
+    def resolve(self, ref: str) -> str | None:
+        """What ``git rev-parse <ref>`` would print, None where it would fail."""
+        refs = self.refs
+        for rule in self._RULES:
+            if (name := rule.format(ref)) in refs: return refs[name]
+        if re.fullmatch(r'[0-9a-f]{40}', ref, re.I): return ref.lower()
+        return self.object(ref)
+
+    def first(self, candidates: list[str]) -> str | None:
+        """The first of ``candidates`` that resolves."""
+        return next((candidate for candidate in candidates if self.resolve(candidate)), None)
 
 
 #MARK: ResolveLocal
-def resolve_local_ref(repo:Repo, ref: str):
-    try:
-        # --verify is reliable for both full and abbreviated hashes
-        local_hash = repo.git.rev_parse(ref)
-        return local_hash
-    except GitCommandError:
-        # handle_error(f"git rev-parse {ref[:8]}", e, opts)
-        return None
+def resolve_local_ref(repo:Repo, ref: str, index: RefIndex | None = None):
+    """Resolve a ref like rev-parse would, from the repo's ``index`` when there is one."""
+    return (index or RefIndex(repo)).resolve(ref)
 
 
 def _local_tracking_candidates(remote: str, ref: str) -> list[str]:
@@ -430,10 +659,55 @@ def _local_tracking_candidates(remote: str, ref: str) -> list[str]:
     return candidates
 
 
-def resolve_local_tracking_ref(repo: Repo, remote: str, ref: str):
+def resolve_local_tracking_ref(repo: Repo, remote: str, ref: str, index: RefIndex | None = None):
     """Resolve a remote branch to a local commit hash, trying known namespaces."""
-    for candidate in _local_tracking_candidates(remote, ref):
-        local_hash = resolve_local_ref(repo, candidate)
-        if local_hash:
-            return local_hash
+    index = index or RefIndex(repo)
+    candidate = index.first(_local_tracking_candidates(remote, ref))
+    return index.resolve(candidate) if candidate else None
+
+
+#MARK: ResolveBuild
+def read_ref(repo: Repo, ref: str) -> str | None:
+    """Resolve a full ref name by reading the ref files, without spawning git."""
+    try:
+        return SymbolicReference.dereference_recursive(repo, ref)
+    except (ValueError, OSError):
+        return None
+
+
+def resolve_build_commit(opts: SimpleNamespace, build: SimpleNamespace) -> str | None:
+    """The commit a build is going to be built from, or None when that can't be told.
+
+    When the source action runs, this is the commit source_git will check out
+    from the bare repo, otherwise the one the worktree already has checked out.
+    Refs are read from disk, so no git process is started, and the commit
+    generate_build_scripts found for the worktree is used when there is one.
+    """
+    if 'source' not in opts.build_actions or 'source' not in getattr(build, 'verbs', []):
+        try:
+            return read_ref(Repo(build.source_path), 'HEAD')
+        except (InvalidGitRepositoryError, NoSuchPathError):
+            return None
+    if getattr(build, 'source_commit', None):
+        return build.source_commit
+
+    gitdef = SimpleNamespace(
+        {**vars(build.source_def), **vars(getattr(opts, 'srcdef', SimpleNamespace()))})
+    ref = getattr(gitdef, 'resolved_commit', None) or getattr(gitdef, 'ref', None)
+    if not ref:
+        return None
+    if re.fullmatch(r'[0-9a-f]{40}', ref, re.I):
+        return ref.lower()
+
+    try:
+        repo = Repo(build.project.path / getattr(gitdef, 'gitdir', 'git'))
+    except (InvalidGitRepositoryError, NoSuchPathError):
+        return None
+    remote = getattr(gitdef, 'remote', 'origin')
+    candidates = [f"refs/remotes/{remote}/{ref}", f"refs/tags/{ref}"]
+    if remote == "origin":
+        candidates.insert(1, f"refs/heads/{ref}")
+    for candidate in candidates:
+        if commit := read_ref(repo, candidate):
+            return commit
     return None
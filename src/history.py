@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""Build history: a SQLite database of build and step durations, used to order builds and spot regressions."""
+import sqlite3
+import statistics
+from contextlib import closing
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from rich.table import Table
+
+from src.ConsoleMultiplex import ConsoleMultiplex
+from src.error import handle_error
+
+console = ConsoleMultiplex()
+
+STATS_DB = "build-stats.db"   # relative to opts.path
+BASELINE_RUNS = 10            # how many previous runs make up the rolling baseline
+SPARKS = "▁▂▃▄▅▆▇█"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id          INTEGER PRIMARY KEY,
+    started     TEXT,
+    project     TEXT NOT NULL,
+    build       TEXT NOT NULL,
+    commit_hash TEXT,
+    toolchain   TEXT,
+    status      TEXT,
+    duration    REAL,
+    fingerprint TEXT,
+    jobs        INTEGER,
+    cpu_time    REAL,
+    peak_rss    INTEGER,
+    avg_rss     INTEGER,
+    read_bytes  INTEGER,
+    write_bytes INTEGER
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id      INTEGER NOT NULL REFERENCES runs(id),
+    step        TEXT NOT NULL,
+    status      TEXT,
+    duration    REAL
+);
+CREATE INDEX IF NOT EXISTS runs_build ON runs(project, build);
+CREATE INDEX IF NOT EXISTS steps_run ON steps(run_id);
+"""
+# Columns added to runs after the first release, with their types.
+ADDED_COLUMNS = {'fingerprint': 'TEXT', 'jobs': 'INTEGER', 'cpu_time': 'REAL', 'peak_rss': 'INTEGER', 'avg_rss': 'INTEGER',
+                 'read_bytes': 'INTEGER', 'write_bytes': 'INTEGER'}
+RESOURCE_COLUMNS = ['cpu_time', 'peak_rss', 'avg_rss', 'read_bytes', 'write_bytes']
+
+
+def parse_duration( value ) -> float | None:
+    """Convert a duration into seconds.
+
+    Accepts the ``timedelta`` stored in ``build.stats['duration']`` and the
+    ``H:MM:SS.fff`` strings the ``Timer`` reports for sub-actions. Placeholders
+    like ``dnr`` and ``dnf`` give None.
+    """
+    if isinstance(value, timedelta): return value.total_seconds()
+    if isinstance(value, (int, float)): return float(value)
+    try:
+        hours, minutes, seconds = str(value).split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return None
+
+
+def format_seconds( seconds:float | None ) -> str:
+    """Show seconds the way the stats table shows durations, ``H:MM:SS.f``."""
+    if seconds is None: return 'n/a'
+    minutes, secs = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours}:{minutes:02}:{secs:04.1f}"
+
+
+def open_db( opts:SimpleNamespace ) -> sqlite3.Connection:
+    """Open the stats database in the working path, creating the tables on first use."""
+    db = sqlite3.connect(opts.path / STATS_DB)
+    db.executescript(SCHEMA)
+    # databases written before builds were fingerprinted or sampled lack the columns
+    columns = {row[1] for row in db.execute("PRAGMA table_info(runs)")}
+    for column, kind in ADDED_COLUMNS.items():
+        if column not in columns: db.execute(f"ALTER TABLE runs ADD COLUMN {column} {kind}")
+    return db
+
+
+def source_commit( build:SimpleNamespace ) -> str:
+    """The commit checked out in the build's worktree, empty when there isn't one."""
+    from git import Repo, InvalidGitRepositoryError, NoSuchPathError
+    try:
+        return Repo(build.source_path).head.commit.hexsha
+    except (InvalidGitRepositoryError, NoSuchPathError, ValueError):
+        return ''
+
+
+# MARK: Record
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  ___                   _                                                   │
+# │ | _ \___ __ ___ _ _ __| |                                                  │
+# │ |   / -_) _/ _ \ '_/ _` |                                                  │
+# │ |_|_\___\__\___/_| \__,_|                                                  │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def record_history( opts:SimpleNamespace, projects:dict[str, SimpleNamespace] ):
+    """Append this run's finished builds and their steps to the stats database.
+
+    Each run is keyed by project, build name, the worktree commit and the
+    toolchain, and keeps the build's fingerprint and sampled resource use. Dry runs, cancelled, skipped
+    and up-to-date builds are not recorded.
+    """
+    if opts.dry: return
+    try:
+        with closing(open_db(opts)) as db, db:
+            for project in projects.values():
+                for build in project.build_configs.values():
+                    stats = getattr(build, 'stats', None)
+                    if not stats or stats.get('status') not in ('Completed', 'Failed', 'TimedOut'): continue
+                    resources = stats.get('resources', {})
+                    cursor = db.execute(
+                        "INSERT INTO runs (started, project, build, commit_hash, toolchain, status, duration, fingerprint, jobs,"
+                        f" {', '.join(RESOURCE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                            (stats.get('start_time') or datetime.now()).isoformat(timespec='seconds'),
+                            project.name, build.name, source_commit(build),
+                            getattr(build.toolchain, 'name', ''),
+                            stats['status'], parse_duration(stats['duration']),
+                            getattr(build, 'fingerprint', None), stats.get('jobs'),
+                            *(resources.get(column) for column in RESOURCE_COLUMNS)))
+                    db.executemany(
+                        "INSERT INTO steps (run_id, step, status, duration) VALUES (?, ?, ?, ?)",
+                        [(cursor.lastrowid, name, sub.get('status'), parse_duration(sub.get('duration')))
+                         for name, sub in stats.get('subs', {}).items()])
+    except sqlite3.Error as e:
+        handle_error(f"record_history {opts.path / STATS_DB}", e, opts)
+
+
+# MARK: Estimate
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  ___    _   _            _                                                 │
+# │ | __|__| |_(_)_ __  __ _| |_ ___                                           │
+# │ | _|(_-<  _| | '  \/ _` |  _/ -_)                                          │
+# │ |___/__/\__|_|_|_|_\__,_|\__\___|                                          │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def load_history( opts:SimpleNamespace, project:SimpleNamespace ) -> dict[str, dict]:
+    """Median timings of a project's recent completed runs, keyed by build name.
+
+    Each entry holds the total ``duration`` and the per step ``subs`` in seconds,
+    taken over the last :data:`BASELINE_RUNS` runs, their 95th percentiles in
+    ``duration_p95`` and ``subs_p95``, and ``rss_per_job``, the most memory in bytes
+    one job of the build needed in those runs, when it was sampled.
+    """
+    if not (opts.path / STATS_DB).exists(): return {}
+    samples:dict[str, dict] = {}
+    try:
+        with closing(open_db(opts)) as db:
+            for build, duration, peak_rss, jobs in db.execute(
+                    "SELECT build, duration, peak_rss, jobs FROM runs WHERE project = ? AND status = 'Completed'"
+                    " ORDER BY id DESC", (project.name,)):
+                entry = samples.setdefault(build, {'duration': [], 'subs': {}, 'rss_per_job': []})
+                if len(entry['duration']) < BASELINE_RUNS:
+                    entry['duration'].append(duration)
+                    if peak_rss: entry['rss_per_job'].append(peak_rss / max(1, jobs or 1))
+            for build, step, duration in db.execute(
+                    "SELECT r.build, s.step, s.duration FROM steps s JOIN runs r ON s.run_id = r.id"
+                    " WHERE r.project = ? AND s.status = 'Completed' ORDER BY r.id DESC", (project.name,)):
+                entry = samples.setdefault(build, {'duration': [], 'subs': {}, 'rss_per_job': []})
+                step_samples = entry['subs'].setdefault(step, [])
+                if len(step_samples) < BASELINE_RUNS: step_samples.append(duration)
+    except sqlite3.Error as e:
+        handle_error(f"load_history {opts.path / STATS_DB}", e, opts)
+        return {}
+
+    def median( values:list ) -> float | None:
+        values = [v for v in values if v is not None]
+        return statistics.median(values) if values else None
+
+    def p95( values:list ) -> float | None:
+        values = [v for v in values if v is not None]
+        if len(values) < 2: return values[0] if values else None
+        return statistics.quantiles(values, n=100, method='inclusive')[94]
+
+    return {build: {
+        'duration': median(entry['duration']),
+        'subs': {step: median(values) for step, values in entry['subs'].items()},
+        'duration_p95': p95(entry['duration']),
+        'subs_p95': {step: p95(values) for step, values in entry['subs'].items()},
+        'rss_per_job': max(entry['rss_per_job'], default=None),
+    } for build, entry in samples.items()}
+
+
+def last_fingerprint( opts:SimpleNamespace, build:SimpleNamespace ) -> str | None:
+    """The fingerprint of the build's most recent completed run, if there is one."""
+    if not (opts.path / STATS_DB).exists(): return None
+    try:
+        with closing(open_db(opts)) as db:
+            row = db.execute(
+                "SELECT fingerprint FROM runs WHERE project = ? AND build = ? AND status = 'Completed'"
+                " ORDER BY id DESC LIMIT 1", (build.project.name, build.name)).fetchone()
+    except sqlite3.Error as e:
+        handle_error(f"last_fingerprint {opts.path / STATS_DB}", e, opts)
+        return None
+    return row[0] if row else None
+
+
+def expected_duration( opts:SimpleNamespace, build:SimpleNamespace, history:dict[str, dict] ) -> float | None:
+    """Estimate how long a build will take for the actions requested on this run.
+
+    Uses the recorded step times when there are any for the requested actions,
+    otherwise the total duration. None when the build has no history.
+    """
+    entry = history.get(build.name)
+    if not entry: return None
+    subs = [entry['subs'][action] for action in opts.build_actions
+            if entry['subs'].get(action) is not None]
+    if subs: return sum(subs)
+    return entry.get('duration')
+
+
+def expected_rss_per_job( build:SimpleNamespace, history:dict[str, dict] ) -> float | None:
+    """The most memory one job of the build needed in its recent runs, None when it was never sampled."""
+    return history.get(build.name, {}).get('rss_per_job')
+
+
+# MARK: Report
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  ___                   _                                                   │
+# │ | _ \___ _ __  ___ _ _| |_                                                 │
+# │ |   / -_) '_ \/ _ \ '_|  _|                                                │
+# │ |_|_\___| .__/\___/_|  \__|                                                │
+# │         |_|                                                                │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def sparkline( values:list[float] ) -> str:
+    """Draw durations, oldest first, as a row of block characters."""
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    return ''.join(SPARKS[int((v - low) / span * (len(SPARKS) - 1))] for v in values)
+
+
+def show_stats_history( opts:SimpleNamespace ):
+    """Show the duration trend of every step of the matching builds, and flag regressions.
+
+    For each project, build and step the table shows the recent trend, the
+    p50/p95 durations over all completed runs, and how the latest run compares
+    to the median of the :data:`BASELINE_RUNS` runs before it. A step more than
+    ``opts.regression`` percent slower than that baseline is flagged.
+    """
+    if not (opts.path / STATS_DB).exists():
+        console.print(f"No build statistics recorded yet in {opts.path / STATS_DB}")
+        return
+
+    table = Table( title="Stats History", highlight=True, min_width=80 )
+    table.add_column( "Project/Config", style="cyan", no_wrap=True )
+    table.add_column( "Step" )
+    table.add_column( "Runs", justify="right" )
+    table.add_column( "Trend" )
+    table.add_column( "Last" )
+    table.add_column( "p50" )
+    table.add_column( "p95" )
+    table.add_column( "Baseline" )
+    table.add_column( "Change", justify="right" )
+    table.add_column( "Commit" )
+
+    regressions = 0
+    with closing(open_db(opts)) as db:
+        for project in opts.projects.values():
+            for build in project.build_configs.values():
+                rows = db.execute(
+                    "SELECT s.step, s.duration, r.commit_hash FROM steps s JOIN runs r ON s.run_id = r.id"
+                    " WHERE r.project = ? AND r.build = ? AND s.status = 'Completed' AND s.duration IS NOT NULL"
+                    " ORDER BY r.id", (project.name, build.name)).fetchall()
+                steps:dict[str, list] = {}
+                for step, duration, commit in rows:
+                    steps.setdefault(step, []).append((duration, commit))
+
+                for step, samples in steps.items():
+                    durations = [d for d, _ in samples]
+                    last, commit = samples[-1]
+                    if len(durations) > 1:
+                        cuts = statistics.quantiles(durations, n=100, method='inclusive')
+                        p50, p95 = cuts[49], cuts[94]
+                    else: p50 = p95 = last
+
+                    previous = durations[-BASELINE_RUNS - 1:-1]
+                    baseline = statistics.median(previous) if previous else None
+                    change = ''
+                    if baseline:
+                        percent = (last - baseline) / baseline * 100
+                        change = f"{percent:+.0f}%"
+                        if percent > opts.regression:
+                            regressions += 1
+                            change = f"[red]{change} regression[/red]"
+
+                    table.add_row(
+                        f"{project.name}/{build.name}", step, str(len(durations)),
+                        sparkline(durations[-BASELINE_RUNS:]), format_seconds(last),
+                        format_seconds(p50), format_seconds(p95), format_seconds(baseline),
+                        change, (commit or '')[:7] )
+
+    console.print(table)
+    if regressions:
+        console.print(f"[red]{regressions} step(s) more than {opts.regression:g}% slower than their baseline[/red]")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""Copy-on-write configuration layers used while expanding build configurations."""
+from copy import copy, deepcopy
+from types import SimpleNamespace
+
+
+class ConfigLayer(SimpleNamespace):
+    """
+    A namespace that stores only its own overrides and reads everything else from a parent.
+
+    Expanding the build matrix used to ``deepcopy`` the whole configuration, toolchain
+    environment included, at every fan-out level. A layer instead starts empty and
+    looks missing attributes up the parent chain. Immutable values are shared as they
+    are; the first time a list, dict or set is read it is shallow-copied into the layer,
+    and a nested namespace is wrapped in a layer of its own, so in-place edits like
+    ``cfg.buildtool.build_vars.append(...)`` never reach the parent or the siblings.
+
+    ``vars(layer)`` only shows the overrides, use :func:`flatten` to get a plain
+    ``SimpleNamespace`` once expansion is done.
+
+    :ivar _parent: The namespace this layer overrides.
+    :type _parent: SimpleNamespace | None
+    :ivar _hidden: Inherited attribute names removed with ``delattr``.
+    :type _hidden: set[str]
+    """
+    __slots__ = ('_parent', '_hidden')
+
+    def __init__(self, parent:SimpleNamespace | None = None, /, **overrides):
+        object.__setattr__(self, '_parent', parent)
+        object.__setattr__(self, '_hidden', set())
+        super().__init__(**overrides)
+
+    def __getattr__(self, name:str):
+        # Only called when the attribute is not one of our own overrides.
+        if name.startswith('__') or name in ConfigLayer.__slots__:
+            raise AttributeError(name)
+        found, value = self._inherited(name)
+        if not found:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        return self._own(name, value)
+
+    def __setattr__(self, name:str, value):
+        self._hidden.discard(name)
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name:str):
+        own = name in self.__dict__
+        if own: super().__delattr__(name)
+        if self._inherited(name)[0]: self._hidden.add(name)
+        elif not own: raise AttributeError(name)
+
+    def __copy__(self):
+        clone = ConfigLayer(self._parent, **self.__dict__)
+        clone._hidden.update(self._hidden)
+        return clone
+
+    def __deepcopy__(self, memo:dict):
+        return deepcopy(flatten(self), memo)
+
+    def _inherited(self, name:str) -> tuple[bool, object]:
+        """Look a name up the parent chain without copying anything."""
+        layer = self
+        while isinstance(layer, ConfigLayer):
+            if name in layer._hidden: break
+            layer = layer._parent
+            if layer is None: break
+            if name in layer.__dict__: return True, layer.__dict__[name]
+        return False, None
+
+    def _own(self, name:str, value):
+        """Copy a mutable inherited value into this layer before handing it out."""
+        if isinstance(value, SimpleNamespace):
+            value = ConfigLayer(value)
+        elif isinstance(value, (list, dict, set)):
+            value = copy(value)
+        else:
+            return value
+        super().__setattr__(name, value)
+        return value
+
+
+def flatten( namespace:SimpleNamespace ) -> SimpleNamespace:
+    """
+    Collapse a chain of :class:`ConfigLayer` into a plain ``SimpleNamespace``.
+
+    Values nobody overrode stay shared with the parent, a nested layer without
+    overrides resolves to the very namespace it was layered on. Treat the result
+    as a snapshot: assign new values rather than editing inherited ones in place.
+
+    :param namespace: A layer, or a plain namespace which is returned unchanged.
+    :return: The resolved namespace.
+    """
+    if not isinstance(namespace, ConfigLayer):
+        return namespace
+    if not namespace.__dict__ and not namespace._hidden:
+        return flatten(namespace._parent) if namespace._parent is not None else SimpleNamespace()
+
+    chain:list[SimpleNamespace] = []
+    layer = namespace
+    while layer is not None:
+        chain.append(layer)
+        layer = layer._parent if isinstance(layer, ConfigLayer) else None
+
+    merged:dict = {}
+    for layer in reversed(chain):
+        for name in getattr(layer, '_hidden', ()):
+            merged.pop(name, None)
+        merged.update(layer.__dict__)
+    return SimpleNamespace(**{k: flatten(v) for k, v in merged.items()})
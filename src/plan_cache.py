@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""Expansion plan cache: keep each project's generated build configurations on disk between runs."""
+import hashlib
+import os
+import pickle
+import re
+import sys
+from pathlib import Path
+from types import SimpleNamespace, FunctionType, MethodType, ModuleType
+
+from src import format as fmt
+
+CACHE_DIR = Path(".cache") / "plans"   # relative to opts.path
+CACHE_VERSION = 1
+
+# Files every project's expansion depends on, relative to opts.path.
+SHARED_INPUTS = ['src/config.py', 'src/expand_config.py', 'src/layer.py', 'src/plan_cache.py',
+                 'share/snippets.py', 'share/script_preamble.py']
+# Environment variables the toolchains read while they are set up.
+RELEVANT_ENV = ['PATH', 'SHELL', 'EMSDK', 'ANDROID_HOME', 'ANDROID_NDK']
+
+
+# MARK: Key
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  _  __                                                                     │
+# │ | |/ /___ _  _                                                             │
+# │ | ' </ -_) || |                                                            │
+# │ |_|\_\___|\_, |                                                            │
+# │           |__/                                                             │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def fingerprint( value ) -> str:
+    """A repr that is the same every run: functions by name, namespaces and dicts sorted."""
+    if callable(value):
+        return f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', type(value).__name__)}"
+    if isinstance(value, SimpleNamespace):
+        value = vars(value)
+    if isinstance(value, dict):
+        return '{' + ', '.join(f"{k!r}: {fingerprint(v)}" for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))) + '}'
+    if isinstance(value, (list, tuple, set)):
+        items = sorted(value, key=str) if isinstance(value, set) else value
+        return '[' + ', '.join(fingerprint(v) for v in items) + ']'
+    return repr(value)
+
+
+def toolchain_fingerprint( toolchain:SimpleNamespace ) -> str:
+    """The toolchain's settings, without its environment.
+
+    Cached builds share the live ``env`` of this run's toolchain, and the variables
+    that shape a toolchain are hashed from :data:`RELEVANT_ENV`.
+    """
+    return fingerprint({k: v for k, v in vars(toolchain).items() if k != 'env'})
+
+
+def plan_key( opts:SimpleNamespace, module:ModuleType ) -> str:
+    """Hash everything a project's ``generate()`` result depends on.
+
+    That is the project's config.py and any other project config it imports, the
+    shared base configs and expansion code, the toolchain sources and the toolchains
+    they produced on this host, the relevant environment, the command line options
+    that shape expansion, and where the tree is, as plans hold absolute paths.
+    """
+    config_file = Path(module.__file__)
+    files = [config_file, *(opts.path / f for f in SHARED_INPUTS), *sorted(opts.path.glob('toolchains/*.py'))]
+    source = config_file.read_text(encoding='utf-8')
+    for other in re.findall(r'(?:from|import)\s+([\w-]+)\.config\b', source):
+        files.append(opts.path / other / 'config.py')
+
+    digest = hashlib.sha256()
+    for file in files:
+        digest.update(str(file.relative_to(opts.path)).encode())
+        digest.update(file.read_bytes() if file.exists() else b'missing')
+    for name, toolchain in sorted(opts.toolchains.items()):
+        digest.update(name.encode())
+        digest.update(toolchain_fingerprint(toolchain).encode())
+    digest.update(repr([
+        CACHE_VERSION, sys.version_info[:2], sys.platform, str(opts.path), opts.debug, opts.build_regex,
+        [os.environ.get(var) for var in RELEVANT_ENV],
+        fingerprint(opts.sources),
+    ]).encode())
+    return digest.hexdigest()[:16]
+
+
+# MARK: Pickle
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  ___ _    _   _                                                            │
+# │ | _ (_)__| |_| |___                                                        │
+# │ |  _/ / _| / / / -_)                                                       │
+# │ |_| |_\__|_\_\_\___|                                                       │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def bind_method( func:FunctionType, obj:object ) -> MethodType:
+    """Rebuild a bound method when a plan is loaded, ``MethodType`` itself can't be pickled."""
+    return MethodType(func, obj)
+
+
+class PlanPickler(pickle.Pickler):
+    """
+    Pickles build configurations, storing references instead of live objects.
+
+    Toolchains and their environments are recreated every run, so they are stored
+    by name. Functions are stored by module and qualified name, because project
+    modules are loaded from file and can't be found by the default pickler.
+    """
+    def __init__(self, file, opts:SimpleNamespace):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.live:dict[int, tuple] = {}
+        for name, toolchain in opts.toolchains.items():
+            self.live[id(toolchain)] = ('toolchain', name)
+            for attr, value in vars(toolchain).items():
+                if isinstance(value, (dict, list, SimpleNamespace)) or callable(value):
+                    self.live.setdefault(id(value), ('toolchain_attr', name, attr))
+
+    def reducer_override(self, obj):
+        # project_base.toolchains is a view of the toolchain dict. It comes back as a view
+        # of a new dict holding the toolchains of when it was pickled, not a live one.
+        if isinstance(obj, type({}.values())):
+            return dict.values, (dict(enumerate(obj)),)
+        # the default pickles a bound method as getattr(self, name), which fails
+        # when it is stored under another name, like configure = MethodType(configure_git, ...)
+        if isinstance(obj, MethodType):
+            return bind_method, (obj.__func__, obj.__self__)
+        return NotImplemented
+
+    def persistent_id(self, obj):
+        if (ref := self.live.get(id(obj))) is not None:
+            return ref
+        if isinstance(obj, FunctionType):
+            if '<' in obj.__qualname__:
+                raise pickle.PicklingError(f"can't cache {obj.__module__}.{obj.__qualname__}")
+            return 'function', obj.__module__, obj.__qualname__
+        return None
+
+
+class PlanUnpickler(pickle.Unpickler):
+    """Resolves the references written by :class:`PlanPickler` against this run."""
+    def __init__(self, file, opts:SimpleNamespace):
+        super().__init__(file)
+        self.opts = opts
+
+    def persistent_load(self, pid):
+        match pid:
+            case ('toolchain', name):
+                return self.opts.toolchains[name]
+            case ('toolchain_attr', name, attr):
+                return getattr(self.opts.toolchains[name], attr)
+            case ('function', module_name, qualname):
+                obj = sys.modules.get(module_name) or self.opts.modules.get(module_name)
+                if obj is None:
+                    raise pickle.UnpicklingError(f"module {module_name} is not loaded")
+                for part in qualname.split('.'):
+                    obj = getattr(obj, part)
+                return obj
+        raise pickle.UnpicklingError(f"unknown reference {pid}")
+
+
+# MARK: Load/Save
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  _                 _   _____                                               │
+# │ | |   ___  __ _ __| | / / __| __ ___ _____                                 │
+# │ | |__/ _ \/ _` / _` |/ /\__ \/ _` \ V / -_)                                │
+# │ |____\___/\__,_\__,_/_/ |___/\__,_|\_/\___|                                │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def load_plan( opts:SimpleNamespace, name:str, key:str ) -> SimpleNamespace | None:
+    """Return the cached project for this key, or None when it has to be generated."""
+    if opts.no_cache: return None
+    cache_path = opts.path / CACHE_DIR / f"{name}.{key}.pickle"
+    if not cache_path.exists(): return None
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            return PlanUnpickler(cache_file, opts).load()
+    except Exception as e:
+        # A stale or unreadable plan only costs a regeneration.
+        if opts.verbose: fmt.hu(f"[yellow]Ignoring cached plan {cache_path.name}: {e!r}")
+        return None
+
+
+def save_plan( opts:SimpleNamespace, name:str, key:str, project:SimpleNamespace ):
+    """Store a freshly generated project, replacing older plans of the same project."""
+    cache_dir = opts.path / CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = cache_dir / f"{name}.{key}.pickle"
+    try:
+        with open(f"{cache_path}.tmp", 'wb') as cache_file:
+            PlanPickler(cache_file, opts).dump(project)
+        os.replace(f"{cache_path}.tmp", cache_path)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        if opts.verbose: fmt.hu(f"[yellow]Not caching {name}: {e}")
+        Path(f"{cache_path}.tmp").unlink(missing_ok=True)
+        return
+    for stale in cache_dir.glob(f"{name}.*.pickle"):
+        if stale != cache_path: stale.unlink(missing_ok=True)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Remote ref cache: what each git URL advertises, listed once and kept on disk between runs and projects."""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import git
+from git import GitCommandError
+
+from src import format as fmt
+from src.error import handle_error
+
+CACHE_FILE = Path(".cache") / "ls-remote.json"   # relative to opts.path
+
+
+def match_ref( refs:dict[str, str], ref:str ) -> str | None:
+    """Find a ref the way ``git ls-remote <url> <ref>`` does, by full name or by its trailing path.
+
+    When several match, the first in ref name order wins, as ls-remote prints them
+    sorted, so a branch is preferred over a tag of the same name.
+    """
+    if ref in refs: return refs[ref]
+    matches = [name for name in refs if name.endswith('/' + ref)]
+    return refs[min(matches)] if matches else None
+
+
+# MARK: Cache
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │   ___         _                                                            │
+# │  / __|__ _ __| |_  ___                                                     │
+# │ | (__/ _` / _| ' \/ -_)                                                    │
+# │  \___\__,_\__|_||_\___|                                                    │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+class RemoteRefCache:
+    """
+    The branches and tags of remote repositories, from one ``git ls-remote`` per URL.
+
+    Every lookup of a URL is answered from its full listing, which is kept in
+    ``.cache/ls-remote.json`` for ``opts.ls_remote_ttl`` seconds, so sources that
+    share a URL, in any project and in later runs, don't ask the remote again.
+    Refs outside ``refs/heads`` and ``refs/tags``, like ``HEAD`` or pull requests,
+    are asked for one at a time and cached alongside. With ``opts.offline`` the
+    cached listings are used however old they are, and nothing is asked.
+
+    Safe to share between threads, a URL is only listed by one of them.
+    """
+    def __init__(self, opts:SimpleNamespace):
+        self.opts = opts
+        self.path = opts.path / CACHE_FILE
+        self.ttl = getattr(opts, 'ls_remote_ttl', 0)
+        self.offline = getattr(opts, 'offline', False)
+        self._lock = threading.Lock()
+        self._url_locks:dict[str, threading.Lock] = {}
+        try: self._entries:dict[str, dict] = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError): self._entries = {}
+
+    def _fresh( self, entry:dict | None ) -> bool:
+        return entry is not None and (self.offline or time.time() - entry['time'] < self.ttl)
+
+    def _save(self):
+        """Write the cache through a temporary file, so an interrupted run leaves the old one."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_suffix('.tmp')
+        # Threads saving at once share the temporary file, so it is replaced under the lock too.
+        with self._lock:
+            temp.write_text(json.dumps(self._entries, indent=1), encoding='utf-8')
+            os.replace(temp, self.path)
+
+    def _ls_remote( self, *args:str ) -> str | None:
+        if self.opts.verbose: fmt.h(f"git ls-remote {' '.join(args)}")
+        try: return git.cmd.Git().ls_remote(*args)
+        except GitCommandError as e:
+            handle_error(f"git ls-remote {' '.join(args)}", e, self.opts)
+            return None
+
+    def refs( self, url:str ) -> dict[str, str] | None:
+        """Every branch and tag the URL advertises, by full ref name. None when it can't be listed."""
+        with self._lock: url_lock = self._url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            entry = self._entries.get(url)
+            if self._fresh(entry): return entry['refs']
+            if self.offline:
+                fmt.hu(f"[yellow]offline: no cached refs for {url}[/yellow]")
+                return None
+            response = self._ls_remote('--heads', '--tags', url)
+            if response is None: return None
+            refs = {}
+            for line in response.splitlines():
+                commit, _, name = line.partition('\t')
+                refs[name] = commit
+            with self._lock: self._entries[url] = {'time': time.time(), 'refs': refs, 'other': {}}
+            self._save()
+            return refs
+
+    def resolve( self, url:str, ref:str ) -> str | None:
+        """The commit hash the URL advertises for ``ref``, None when it doesn't have it."""
+        refs = self.refs(url)
+        if refs is None: return None
+        if commit := match_ref(refs, ref): return commit
+
+        # Not a branch or tag, so ask for it by name, once per listing.
+        entry = self._entries[url]
+        if ref in entry['other'] or self.offline: return entry['other'].get(ref)
+        response = self._ls_remote(url, ref)
+        commit = response.split()[0] if response else None
+        with self._lock: entry['other'][ref] = commit
+        self._save()
+        return commit
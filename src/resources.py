@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""Resource sampling: CPU time, memory and disk I/O of a build's whole process tree, read from /proc."""
+import os
+import threading
+from pathlib import Path
+
+PROC = Path('/proc')
+SAMPLE_INTERVAL = 0.5   # seconds between samples
+
+_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+_PAGE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def format_bytes( size:float | None ) -> str:
+    """Show a byte count in binary units, ``1.5G``."""
+    if size is None: return 'n/a'
+    for unit in ['B', 'K', 'M', 'G']:
+        if abs(size) < 1024: return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}T"
+
+
+def sampling_supported() -> bool:
+    """Only Linux has a /proc to read, elsewhere builds go unsampled."""
+    return (PROC / 'self' / 'stat').exists()
+
+
+def memory_info() -> tuple[int, int] | None:
+    """Total and available memory in bytes from /proc/meminfo, None where there is no /proc."""
+    try: text = (PROC / 'meminfo').read_text()
+    except OSError: return None
+    values = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(':')
+        values[name] = int(value.split()[0]) * 1024   # reported in KiB
+    if 'MemTotal' not in values: return None
+    return values['MemTotal'], values.get('MemAvailable', values.get('MemFree', 0))
+
+
+def _read_stat( pid:int ) -> tuple[int, float, int] | None:
+    """Parent pid, CPU seconds and resident bytes of a process, None when it is gone."""
+    try: stat = (PROC / str(pid) / 'stat').read_bytes()
+    except OSError: return None
+    # the command name is in parentheses and may contain spaces, the fields follow the last ')'
+    fields = stat[stat.rindex(b')') + 2:].split()
+    ppid, utime, stime, rss = int(fields[1]), int(fields[11]), int(fields[12]), int(fields[21])
+    return ppid, (utime + stime) / _TICKS, rss * _PAGE
+
+
+def _read_io( pid:int ) -> tuple[int, int]:
+    """Bytes a process read from and wrote to storage, zeros when the kernel doesn't say."""
+    try: text = (PROC / str(pid) / 'io').read_text()
+    except OSError: return 0, 0
+    values = dict(line.split(': ') for line in text.splitlines() if ': ' in line)
+    return int(values.get('read_bytes', 0)), int(values.get('write_bytes', 0))
+
+
+def process_tree( root:int ) -> dict[int, tuple[int, float, int]]:
+    """The parent pid, CPU seconds and resident bytes of a process and all of its descendants."""
+    stats = {}
+    for entry in PROC.iterdir():
+        if entry.name.isdigit() and (stat := _read_stat(int(entry.name))):
+            stats[int(entry.name)] = stat
+    children:dict[int, list[int]] = {}
+    for pid, (ppid, _, _) in stats.items():
+        children.setdefault(ppid, []).append(pid)
+    tree, frontier = {}, [root]
+    while frontier:
+        pid = frontier.pop()
+        if pid in stats:
+            tree[pid] = stats[pid]
+            frontier.extend(children.get(pid, []))
+    return tree
+
+
+class TreeSampler:
+    """
+    Samples a process and all of its descendants on a background thread.
+
+    Every :data:`SAMPLE_INTERVAL` the tree is found again by walking /proc, the RSS
+    of its live processes summed, and the CPU time and I/O of each process noted.
+    Those only grow, so the last value seen of every process is kept and summed when
+    sampling stops. A process that starts and exits between two samples is missed,
+    and so is the last moment of each process, so the figures are a lower bound.
+
+    The root can be a long-lived process, like a worker of the script pool; its CPU
+    time and I/O are counted from when sampling started.
+
+    :ivar pid: The root of the sampled tree, once started.
+    :type pid: int | None
+    :ivar usage: The summary, filled in by :meth:`stop`.
+    :type usage: dict | None
+    """
+    def __init__(self, interval:float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.usage:dict | None = None
+        self.pid:int | None = None
+        self._stop = threading.Event()
+        self._thread:threading.Thread | None = None
+        self._cpu:dict[int, float] = {}
+        self._io:dict[int, tuple[int, int]] = {}
+        self._baseline:tuple[float, int, int] = (0.0, 0, 0)
+        self._rss:list[int] = []
+
+    def start(self, pid:int):
+        """Start sampling the tree below ``pid``, only noting the pid where /proc isn't available."""
+        self.pid = pid
+        if not sampling_supported(): return
+        stat = _read_stat(pid)
+        self._baseline = (stat[1] if stat else 0.0, *_read_io(pid))
+        self._thread = threading.Thread(target=self._run, name=f'sample-{pid}', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval): break
+
+    def sample(self):
+        """Take one sample of the tree."""
+        tree = process_tree(self.pid)
+        if not tree: return
+        self._rss.append(sum(rss for _, _, rss in tree.values()))
+        for pid, (_, cpu, _) in tree.items():
+            self._cpu[pid] = cpu
+            self._io[pid] = _read_io(pid)
+
+    def stop(self) -> dict | None:
+        """Stop sampling and summarise, None when nothing was sampled.
+
+        :return: ``cpu_time`` in seconds, ``peak_rss`` and ``avg_rss`` of the whole
+            tree and ``read_bytes``/``write_bytes`` in bytes, and the number of ``samples``.
+        """
+        if self._thread is None: return None
+        self._stop.set()
+        self._thread.join()
+        if not self._rss: return None
+        # the baseline only applies when the root itself was sampled
+        cpu_base, read_base, write_base = self._baseline if self.pid in self._cpu else (0.0, 0, 0)
+        self.usage = {
+            'cpu_time': round(sum(self._cpu.values()) - cpu_base, 2),
+            'peak_rss': max(self._rss),
+            'avg_rss': sum(self._rss) // len(self._rss),
+            'read_bytes': sum(r for r, _ in self._io.values()) - read_base,
+            'write_bytes': sum(w for _, w in self._io.values()) - write_base,
+            'samples': len(self._rss),
+        }
+        return self.usage
@@ -4,23 +4,185 @@ real time, mimicking the behavior of `subprocess.run`.
 
 The `stream_command` function allows for handling of command output (both stdout and stderr)
 with real-time processing, optional simulation (dry runs), and simplified integration with
-custom environment variables or output handlers.
+custom environment variables or output handlers. Commands run on one shared asyncio event
+loop, `stream_command_async` is the awaitable form for callers that run several at once.
 
 References:
 - https://www.devgem.io/posts/capturing-realtime-output-from-a-subprocess-in-python
 - https://stackoverflow.com/questions/54091396/live-output-stream-from-python-subprocess
 - https://docs.python.org/3.12/library/shlex.html#shlex.split
 """
+import asyncio
 import os
 import shlex
-from collections import deque
-from typing import cast, BinaryIO, TextIO
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
 
 from rich import print
 
-from concurrent.futures import ThreadPoolExecutor
-from subprocess import PIPE, CalledProcessError, CompletedProcess, Popen
-from functools import partial
+from src.events import EVENTS_ENV, emit
+from src.resources import TreeSampler, process_tree, sampling_supported
+
+from subprocess import PIPE, CalledProcessError, CompletedProcess
+
+# Output lines longer than this are split, asyncio's default of 64KiB is too small for some compilers.
+LINE_LIMIT = 1024 * 1024
+# The most a batched read takes from a stream at once.
+CHUNK_SIZE = 64 * 1024
+
+_loop:asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def command_loop() -> asyncio.AbstractEventLoop:
+    """The event loop shared by every :func:`stream_command` call, started on first use.
+
+    It runs in a daemon thread, so the children of all concurrently running builds
+    are read by one thread instead of two per command.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='stream-command-loop', daemon=True).start()
+        return _loop
+
+
+async def _pump( stream:asyncio.StreamReader, handler:Callable, text:bool ) -> int:
+    """Hand each line of a child's stream to its handler until the stream closes, and return the bytes read."""
+    size = 0
+    while True:
+        try:
+            line = await stream.readline()
+        except ValueError:  # longer than LINE_LIMIT, hand over what fits
+            line = await stream.read(LINE_LIMIT)
+        if not line: break
+        size += len(line)
+        line = line.rstrip()
+        handler(line.decode('utf-8', errors='backslashreplace') if text else line)
+    return size
+
+
+async def _pump_batches( stream:asyncio.StreamReader, handler:Callable, text:bool ) -> int:
+    """Hand a child's stream to its handler as lists of lines, one list per chunk read, and return the bytes read."""
+    size, partial = 0, b''
+    while chunk := await stream.read(CHUNK_SIZE):
+        size += len(chunk)
+        head, newline, partial = (partial + chunk).rpartition(b'\n')
+        if newline: handler(_split_lines(head, text))
+        elif len(partial) > LINE_LIMIT:  # no line end in sight, hand over what we have
+            handler(_split_lines(partial, text))
+            partial = b''
+    if partial: handler(_split_lines(partial, text))
+    return size
+
+
+def kill_process_tree( pid:int, *, group:bool=False, include_root:bool=True ):
+    """Kill a process and everything it started.
+
+    Args:
+        pid (int): The root of the tree.
+        group (bool, optional): The root leads its own process group, it was started with
+            ``start_new_session``, so the whole group is killed at once. Defaults to False.
+        include_root (bool, optional): Kill the root too, not just its descendants. Defaults to True.
+    """
+    if sys.platform == 'win32':
+        if include_root: subprocess.run(['taskkill', '/T', '/F', '/PID', str(pid)], capture_output=True)
+        return
+    if group and include_root:
+        try: os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError): pass
+        return
+    # without /proc only the root can be found
+    tree = process_tree(pid) if sampling_supported() else {pid: None}
+    for member in tree:
+        if member == pid and not include_root: continue
+        try: os.kill(member, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError): pass
+
+
+def _split_lines( data:bytes, text:bool ) -> list:
+    """Decode a run of complete lines in one go, and split it."""
+    if text: data = data.decode('utf-8', errors='backslashreplace')
+    return [line.rstrip() for line in data.split('\n' if text else b'\n')]
+
+
+async def stream_command_async(
+    args,
+    *,
+    dry=False,
+    quiet=False,
+    env=None,
+    stdout_handler=print,
+    stderr_handler=print,
+    check=True,
+    text=True,
+    stdout=PIPE,
+    stderr=PIPE,
+    batch=False,
+    sampler:TreeSampler|None=None,
+    **kwargs,
+) -> CompletedProcess:
+    """Execute a command and stream its output in real time, without blocking the event loop.
+
+    Takes the same arguments as :func:`stream_command`. The handlers are called on
+    the loop, so they should return quickly, use batch for noisy commands.
+    Cancelling the task kills the command. When its events are recorded, a command
+    without a sampler gets one of its own, for the usage in ``command_end``.
+
+    Returns:
+        CompletedProcess: The result of the command execution.
+
+    Raises:
+        CalledProcessError: If check is True and the command exits with a non-zero code.
+    """
+    if not quiet:
+        for l in [f'CWD {kwargs.get('cwd') or os.getcwd()}',f'  $ {args}']: print(l)
+
+    if isinstance(args, str): # If the command is a string Split into a list
+        args = shlex.split( args )
+
+    if dry: # pretend the command executed successfully
+        return CompletedProcess( args, 0 )
+
+    if sampler is None and os.environ.get(EVENTS_ENV): sampler = TreeSampler()
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=stdout, stderr=stderr, env=env, limit=LINE_LIMIT, **kwargs)
+    start = time.monotonic()
+    if sampler: sampler.start(process.pid)
+    emit('command_start', pid=process.pid, args=args, cwd=kwargs.get('cwd') or os.getcwd())
+    pump = _pump_batches if batch else _pump
+    pumps = [asyncio.create_task(pump(stream, handler, text)) for stream, handler in
+             [(process.stdout, stdout_handler), (process.stderr, stderr_handler)] if stream is not None]
+    try:
+        output_bytes = sum(await asyncio.gather(*pumps))
+        retcode = await process.wait()
+    except BaseException as e:
+        # cancelled, or a handler raised: don't leave the command running, nor unreaped
+        # Its children go too, a new session doesn't get the terminal's Ctrl+C, and
+        # anything holding the pipes open would keep the wait below from returning.
+        if process.returncode is None:
+            kill_process_tree(process.pid, group=bool(kwargs.get('start_new_session')))
+        for task in pumps: task.cancel()
+        await asyncio.gather(*pumps, return_exceptions=True)
+        await process.wait()
+        emit('command_end', pid=process.pid, returncode=process.returncode,
+             duration=time.monotonic() - start,
+             **({'cancelled': True} if isinstance(e, asyncio.CancelledError) else {'error': repr(e)}))
+        raise
+    finally:
+        usage = await asyncio.to_thread(sampler.stop) if sampler else None
+    emit('command_end', pid=process.pid, returncode=retcode, duration=time.monotonic() - start,
+         output_bytes=output_bytes, **(usage or {}))
+    if check and retcode:
+        raise CalledProcessError( retcode, args )
+    return CompletedProcess( args, retcode )
+
 
 # https://www.devgem.io/posts/capturing-realtime-output-from-a-subprocess-in-python
 # https://stackoverflow.com/questions/54091396/live-output-stream-from-python-subprocess
@@ -37,11 +199,16 @@ def stream_command(
     text=True,
     stdout=PIPE,
     stderr=PIPE,
+    batch=False,
+    sampler=None,
     **kwargs,
 ):
     """Execute a command and stream its output in real time.
     Mimic subprocess.run, while processing the command output in real time.
 
+    This is the blocking wrapper around :func:`stream_command_async`, the command
+    runs on the shared :func:`command_loop` and this thread waits for it.
+
     Args:
         args (str or list): The command to execute, as a string or list of arguments.
         dry (bool, optional): If True, simulate execution without running the command. Defaults to False.
@@ -53,7 +220,11 @@ def stream_command(
         text (bool, optional): If True, treat output as text. Defaults to True.
         stdout (file, optional): Standard output destination. Defaults to subprocess.PIPE.
         stderr (file, optional): Standard error destination. Defaults to subprocess.PIPE.
-        **kwargs: Additional arguments for subprocess.Popen.
+        batch (bool, optional): If True, read the streams in large chunks and pass the handlers
+            a list of lines per chunk instead of one line per call. Defaults to False.
+        sampler (TreeSampler, optional): Samples the CPU, memory and I/O of the command's process
+            tree while it runs, the summary is left in its ``usage``. Defaults to None.
+        **kwargs: Additional arguments for asyncio.create_subprocess_exec.
 
     Returns:
         CompletedProcess: The result of the command execution.
@@ -61,31 +232,14 @@ def stream_command(
     Raises:
         CalledProcessError: If check is True and the command exits with a non-zero code.
     """
-
-    if not quiet:
-        for l in [f'CWD {os.getcwd()}',f'  $ {args}']: print(l)
-
-    if isinstance(args, str): # If the command is a string Split into a list
-        args = shlex.split( args )
-
-    if dry: # pretend the command executed successfully
-        return CompletedProcess( args, 0 )
-
-    with (
-        # errors: 'strict', 'replace', 'ignore', 'backslashreplace'
-        Popen(args, bufsize=1, stdout=stdout, stderr=stderr, env=env, **kwargs, text=text, encoding='utf-8', errors='backslashreplace') as process,
-        ThreadPoolExecutor(2) as pool,  # two threads to handle the (live) streams separately
-    ):
-        exhaust = partial(deque, maxlen=0)  # collections recipe: exhaust an iterable at C-speed
-        exhaust_async = partial(pool.submit, exhaust)  # exhaust non-blocking in a background thread
-        # NOTE: The use of cast here is to shit up pycharm warnings which cant discern that the process.stdout/err
-        #   can be iterated over, with error: "Expected type 'collections.Iterable', got 'int' instead"
-        exhaust_async(stdout_handler(line.rstrip()) for line in cast(TextIO if text else BinaryIO, process.stdout))
-        exhaust_async(stderr_handler(line.rstrip()) for line in cast(TextIO if text else BinaryIO, process.stderr))
-    retcode = process.poll()  # block until both iterables are exhausted (process finished)
-    if check and retcode:
-        raise CalledProcessError(
-            retcode,
-            process.args
-        )
-    return CompletedProcess( process.args, retcode )
+    future:Future = asyncio.run_coroutine_threadsafe(
+        stream_command_async( args, dry=dry, quiet=quiet, env=env,
+                              stdout_handler=stdout_handler, stderr_handler=stderr_handler,
+                              check=check, text=text, stdout=stdout, stderr=stderr, batch=batch,
+                              sampler=sampler, **kwargs ),
+        command_loop() )
+    try:
+        return future.result()
+    except KeyboardInterrupt:
+        future.cancel()     # kills the command
+        raise
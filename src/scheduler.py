@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+"""Build scheduling: run builds in dependency order, several at once, sharing one -j budget."""
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Iterable
+
+from rich import print
+
+from src import format as fmt
+from src.ConsoleMultiplex import ConsoleMultiplex
+from src.resources import format_bytes, memory_info
+
+console = ConsoleMultiplex()
+
+GIB = 1024 ** 3
+
+
+# MARK: Job Budget
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │     _     _      ___         _          _                                  │
+# │  _ | |___| |__  | _ )_  _ __| |__ _ ___| |_                                │
+# │ | || / _ \ '_ \ | _ \ || / _` / _` / -_)  _|                               │
+# │  \__/\___/_.__/ |___/\_,_\__,_\__, \___|\__|                               │
+# │                               |___/                                        │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+class JobBudget:
+    """
+    Hands out slices of the global ``--jobs`` count to concurrently running builds.
+
+    Each build takes an even share of whatever is currently free, spread over the
+    builds that could still start. When the queue drains, the last builds to start
+    get the jobs released by the ones that finished before them.
+
+    :ivar total: The overall job count, usually ``opts.jobs``.
+    :type total: int
+    :ivar used: Jobs currently handed out to running builds.
+    :type used: int
+    """
+    def __init__(self, total:int):
+        self.total = max(1, total)
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self, slots:int) -> int:
+        """
+        Reserve a share of the free jobs for a build that is about to start.
+
+        :param slots: The number of builds that could start right now, including this one.
+        :return: The number of jobs reserved, always at least one.
+        """
+        with self._lock:
+            free = max(0, self.total - self.used)
+            jobs = max(1, free // max(1, slots))
+            self.used += jobs
+            return jobs
+
+    def give(self, jobs:int):
+        """Return jobs reserved by :meth:`take` once the build has finished."""
+        with self._lock:
+            self.used = max(0, self.used - jobs)
+
+
+# MARK: Memory Budget
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  __  __                          ___         _          _                  │
+# │ |  \/  |___ _ __  ___ _ _ _  _  | _ )_  _ __| |__ _ ___| |_                │
+# │ | |\/| / -_) '  \/ _ \ '_| || | | _ \ || / _` / _` / -_)  _|               │
+# │ |_|  |_\___|_|_|_\___/_|  \_, | |___/\_,_\__,_\__, \___|\__|               │
+# │                           |__/                |___/                        │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+class MemoryBudget:
+    """
+    Admits builds only while their predicted memory fits, trimming their job count to fit.
+
+    A build is predicted to need ``jobs`` times the most memory one of its jobs
+    needed in recent runs, or ``opts.mem_per_job`` GiB per job without history.
+    The predictions of the running builds plus a headroom of ``opts.mem_headroom``
+    percent of the total must fit in the machine's memory, and a new build also
+    has to fit in what is available right now. Where the memory can't be read
+    every build starts with the jobs it was given.
+
+    :ivar reserved: The predicted bytes of each running build, by index.
+    :type reserved: dict[int, float]
+    """
+    def __init__(self, opts:SimpleNamespace, rss_per_job:list[float | None]):
+        default = getattr(opts, 'mem_per_job', 2.0) * GIB
+        self.rss_per_job = [rss or default for rss in rss_per_job]
+        self.headroom = getattr(opts, 'mem_headroom', 10.0) / 100
+        self.reserved:dict[int, float] = {}
+        self._held:set[int] = set()
+        self._lock = threading.Lock()
+
+    def fit(self, index:int, jobs:int, alone:bool, name:str) -> int:
+        """
+        Work out how many jobs a build can start with.
+
+        :param index: The build's index in the scheduled builds.
+        :param jobs: The jobs the build was given, the most it will get.
+        :param alone: Nothing else is running, so the build starts with one job even if it doesn't fit.
+        :param name: Shown when the build is held back or trimmed.
+        :return: Between one and ``jobs``, or 0 to hold the build back until another finishes.
+        """
+        info = memory_info()
+        if info is None: return jobs
+        total, available = info
+        with self._lock:
+            committed = sum(self.reserved.values())
+        room = min(total * (1 - self.headroom) - committed, available - total * self.headroom)
+        per_job = self.rss_per_job[index]
+        fitting = min(jobs, int(room // per_job))
+        if fitting < 1 and not alone:
+            if index not in self._held:
+                self._held.add(index)
+                fmt.h(f"[yellow]Holding back {name}: needs {format_bytes(per_job)} per job,"
+                      f" {format_bytes(max(room, 0))} to spare[/yellow]")
+            return 0
+        fitting = max(1, fitting)
+        if fitting < jobs:
+            fmt.h(f"[yellow]{name}: {fitting} of {jobs} jobs to fit in memory[/yellow]")
+        return fitting
+
+    def take(self, index:int, jobs:int):
+        """Reserve the predicted memory of a build that is starting with ``jobs``."""
+        with self._lock:
+            self.reserved[index] = self.rss_per_job[index] * jobs
+
+    def give(self, index:int):
+        """Release the reservation of a build that finished."""
+        with self._lock:
+            self.reserved.pop(index, None)
+
+
+# MARK: Artifacts
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │    _       _   _  __         _                                             │
+# │   /_\  _ _| |_(_)/ _|__ _ __| |_ ___                                       │
+# │  / _ \| '_|  _| |  _/ _` / _|  _(_-<                                       │
+# │ /_/ \_\_|  \__|_|_| \__,_\__|\__/__/                                       │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def consumed_keys( opts:SimpleNamespace, build:SimpleNamespace ) -> list[str]:
+    """Return the artifact keys a build needs for the build actions requested on this run.
+
+    ``build.consumes`` maps a build action to the artifact keys that action reads,
+    e.g. ``{'test': ['godot.windows.editor.x86_64']}``, so a build only waits on its
+    upstream when it is actually going to use it.
+    """
+    keys:list[str] = []
+    for action, action_keys in getattr(build, 'consumes', {}).items():
+        if action in opts.build_actions and action in getattr(build, 'verbs', []):
+            keys += [k for k in action_keys if k not in keys]
+    return keys
+
+
+def artifact_exists( build:SimpleNamespace, key:str ) -> bool:
+    """Check whether the files a build declares for an artifact key are on disk.
+
+    ``build.produces`` maps an artifact key to a glob relative to ``build.source_path``.
+    """
+    pattern = getattr(build, 'produces', {}).get(key)
+    if pattern is None: return False
+    return any(Path(build.source_path).glob(pattern))
+
+
+def build_dependencies( opts:SimpleNamespace, builds:list[SimpleNamespace] ) -> list[set[int]]:
+    """Map each build, by index, to the indices of the builds producing what it consumes.
+
+    Only producers that are part of this run count. An artifact nobody in the run
+    produces is assumed to already be on disk, or its absence is the consumer's
+    problem to report.
+    """
+    producers:dict[str, list[int]] = {}
+    for i, build in enumerate(builds):
+        for key in getattr(build, 'produces', {}):
+            producers.setdefault(key, []).append(i)
+
+    deps:list[set[int]] = []
+    for i, build in enumerate(builds):
+        deps.append({p for key in consumed_keys(opts, build) for p in producers.get(key, []) if p != i})
+    return deps
+
+
+def block_build( build:SimpleNamespace, reason:str ):
+    """Record that a build was never started because its upstream did not deliver."""
+    setattr( build, 'stats', { # type: ignore[attr-defined]
+        'status': 'Blocked',
+        'duration': 'dnr',
+        'reason': reason,
+        'subs': {}
+    })
+    fmt.h(f"[yellow]Blocked: {build.project.name}/{build.name} - {reason}[/yellow]")
+
+
+def upstream_problem( opts:SimpleNamespace, build:SimpleNamespace, upstream:list[SimpleNamespace] ) -> str | None:
+    """Return why a build cannot start now that its producers have finished, or None if it can.
+
+    A producer that was skipped or disabled didn't fail, what it produced on an
+    earlier run will do when it is still on disk.
+    """
+    for producer in upstream:
+        status = getattr(producer, 'stats', {}).get('status')
+        if status not in ('Completed', 'Up-to-date', 'Dry-Run', 'Skipped', 'Disabled'):
+            return f"upstream {producer.name} finished with status {status}"
+    if opts.dry: return None
+    for key in consumed_keys(opts, build):
+        owners = [p for p in upstream if key in getattr(p, 'produces', {})]
+        if owners and not any(artifact_exists(p, key) for p in owners):
+            return f"artifact '{key}' is missing"
+    return None
+
+
+# MARK: Ordering
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │   ___         _         _                                                  │
+# │  / _ \ _ _ __| |___ _ _(_)_ _  __ _                                        │
+# │ | (_) | '_/ _` / -_) '_| | ' \/ _` |                                       │
+# │  \___/|_| \__,_\___|_| |_|_||_\__, |                                       │
+# │                               |___/                                        │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def critical_path_order( deps:list[set[int]], expected:list[float | None] ) -> list[int]:
+    """Order build indices longest-critical-path first.
+
+    A build's priority is its own expected duration plus the longest chain of
+    builds waiting on it, so producers of a long downstream chain start early
+    and, without dependencies, this is plain longest-processing-time first.
+    Builds with no history are assumed to take the average known time. Ties
+    keep the configured order.
+    """
+    known = [e for e in expected if e is not None]
+    default = sum(known) / len(known) if known else 0.0
+    weight = [default if e is None else e for e in expected]
+
+    dependants:list[list[int]] = [[] for _ in deps]
+    for i, upstream in enumerate(deps):
+        for d in upstream: dependants[d].append(i)
+
+    priority:dict[int, float] = {}
+    def chain( index:int, visiting:frozenset = frozenset() ) -> float:
+        if index in priority: return priority[index]
+        if index in visiting: return 0.0 # cycle, reported by the scheduler
+        tail = max((chain(d, visiting | {index}) for d in dependants[index]), default=0.0)
+        priority[index] = weight[index] + tail
+        return priority[index]
+
+    return sorted(range(len(deps)), key=lambda i: -chain(i))
+
+
+# MARK: Schedule
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  ___     _           _      _                                              │
+# │ / __| __| |_  ___ __| |_  _| |___                                          │
+# │ \__ \/ _| ' \/ -_) _` | || | / -_)                                         │
+# │ |___/\__|_||_\___\__,_|\_,_|_\___|                                         │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+def schedule_builds( opts:SimpleNamespace, builds:Iterable[SimpleNamespace],
+                     run_build:Callable[[SimpleNamespace, SimpleNamespace, int], None],
+                     expected:list[float | None] | None = None, memory:MemoryBudget | None = None ):
+    """Run ``run_build(opts, build, jobs)`` for every build, up to ``opts.parallel`` at once.
+
+    Builds start in the given order, except that a build consuming an artifact
+    waits until every build in the run producing that artifact has finished, and
+    is marked "Blocked" if one of them failed or its files are missing. Builds
+    from different projects can be mixed freely, which is how a godot-cpp test
+    starts as soon as the Godot editor it needs exists.
+
+    With a parallelism of one the builds run on the calling thread, so
+    KeyboardInterrupt handling inside ``run_build`` behaves exactly as before.
+    Otherwise builds run on a thread pool; each one is given its share of the
+    ``opts.jobs`` budget when it starts, and when ``expected`` durations are
+    given the builds start in :func:`critical_path_order`. With a ``memory`` budget
+    a build is also held back while its predicted memory doesn't fit, and its job
+    count is trimmed to what does, serial builds included.
+
+    Args:
+        opts (SimpleNamespace): Global options, uses ``parallel``, ``jobs`` and ``build_actions``.
+        builds (Iterable[SimpleNamespace]): The builds to run, in the preferred start order.
+        run_build (Callable): Called with ``(opts, build, jobs)`` for each build.
+        expected (list[float | None]): Expected seconds per build from history, None where unknown.
+        memory (MemoryBudget): Admits builds and trims their jobs by predicted memory use.
+
+    Raises:
+        KeyboardInterrupt: Propagated after running builds have finished, pending builds are dropped.
+    """
+    builds = list(builds)
+    deps = build_dependencies(opts, builds)
+    pending:list[int] = list(range(len(builds)))
+    finished:set[int] = set()
+    total = len(builds)
+    parallel = max(1, min(getattr(opts, 'parallel', 1), opts.jobs, total or 1))
+
+    # Run time only shrinks when builds overlap, serial runs keep the configured order.
+    if parallel > 1 and expected is not None:
+        pending = critical_path_order(deps, expected)
+
+    def next_ready() -> int | None:
+        """Pop the first pending build whose producers have all finished, blocking it if they failed."""
+        while True:
+            index = next((i for i in pending if deps[i] <= finished), None)
+            if index is None: return None
+            pending.remove(index)
+            build = builds[index]
+            problem = upstream_problem(opts, build, [builds[d] for d in sorted(deps[index])])
+            if problem is None: return index
+            block_build(build, problem)
+            finished.add(index)
+
+    def block_remaining():
+        """Whatever is still pending waits on itself, a dependency cycle."""
+        for i in pending:
+            block_build(builds[i], "dependency cycle")
+        pending.clear()
+
+    if parallel == 1:
+        while (index := next_ready()) is not None:
+            jobs = memory.fit(index, opts.jobs, True, builds[index].name) if memory else opts.jobs
+            run_build(opts, builds[index], jobs)
+            finished.add(index)
+        block_remaining()
+        return
+
+    budget = JobBudget(opts.jobs)
+    running:dict = {}
+
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='build') as pool:
+        try:
+            while pending or running:
+                while len(running) < parallel and (index := next_ready()) is not None:
+                    ready = sum(1 for i in pending if deps[i] <= finished) + 1
+                    jobs = budget.take(min(parallel - len(running), ready))
+                    if memory:
+                        fitted = memory.fit(index, jobs, not running, builds[index].name)
+                        budget.give(jobs - fitted)
+                        if not fitted:  # wait for a running build to free its memory
+                            pending.insert(0, index)
+                            break
+                        jobs = fitted
+                        memory.take(index, jobs)
+                    running[pool.submit(run_build, opts, builds[index], jobs)] = (index, jobs)
+
+                if not running:
+                    block_remaining()
+                    break
+
+                console.set_window_title(f"AutoBuild [{len(finished)}:{total}] - {len(running)} running")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, jobs = running.pop(future)
+                    budget.give(jobs)
+                    if memory: memory.give(index)
+                    finished.add(index)
+                    # Surface unexpected errors, process_build handles the expected ones.
+                    future.result()
+        except KeyboardInterrupt:
+            print(f"Cancelling {len(pending)} pending builds, waiting on {len(running)} running builds")
+            pending.clear()
+            wait(running)
+            raise
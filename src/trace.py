@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Run timeline: turn a run's events.jsonl into a Chrome trace-event file for chrome://tracing or Perfetto."""
+import json
+from pathlib import Path
+
+from src.events import read_events
+
+RUN_PID = 0   # the track group for what the runner does outside of builds
+
+
+def _slice( name:str, pid:int, tid:int, start:float, end:float, t0:float, args:dict | None = None ) -> dict:
+    """A complete ('X') event, times are in microseconds from the start of the run."""
+    return {'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+            'ts': (start - t0) * 1e6, 'dur': max(end - start, 0) * 1e6, 'args': args or {}}
+
+
+def _track_name( kind:str, pid:int, tid:int | None, name:str ) -> dict:
+    event = {'name': kind, 'ph': 'M', 'pid': pid, 'args': {'name': name}}
+    if tid is not None: event['tid'] = tid
+    return event
+
+
+def trace_events( events:list[dict] ) -> list[dict]:
+    """Build the trace from the events of a run.
+
+    Every project is a process with the project itself on its first track, spanning
+    everything recorded for it, fetching included. Every build gets its own track,
+    with the phases timed by ``Timer`` nested in the build and the commands run by
+    ``stream_command`` nested in those. The runner's own spans, like generating the
+    scripts, go on the first process.
+    """
+    if not events: return []
+    t0 = min(event['time'] for event in events)
+    end_of_run = max(event['time'] for event in events)
+
+    trace = [_track_name('process_name', RUN_PID, None, 'AutoBuild'),
+             _track_name('thread_name', RUN_PID, 0, 'run')]
+    projects:dict[str, int] = {}
+    builds:dict[tuple[str, str], tuple[int, int]] = {}
+    project_span:dict[str, list[float]] = {}
+
+    def track( project:str, build:str | None ) -> tuple[int, int]:
+        if project not in projects:
+            projects[project] = pid = len(projects) + 1
+            trace.extend([_track_name('process_name', pid, None, project),
+                          _track_name('thread_name', pid, 0, project)])
+        pid = projects[project]
+        if build is None: return pid, 0
+        if (project, build) not in builds:
+            tid = sum(1 for p, _ in builds if p == project) + 1
+            builds[(project, build)] = (pid, tid)
+            trace.append(_track_name('thread_name', pid, tid, build))
+        return builds[(project, build)]
+
+    # Starts wait here for their end, keyed by track and name, or by pid for commands.
+    open_spans:dict[tuple, list[dict]] = {}
+    for event in sorted(events, key=lambda e: e['time']):
+        kind:str = event['event']
+        project, build = event.get('project'), event.get('build')
+        if project:
+            span = project_span.setdefault(project, [event['time'], event['time']])
+            span[0], span[1] = min(span[0], event['time']), max(span[1], event['time'])
+            pid, tid = track(project, build)
+        else: pid, tid = RUN_PID, 0
+
+        base, _, edge = kind.rpartition('_')
+        name = event.get('name') or base
+        key = (pid, tid, base, event['pid']) if base == 'command' else (pid, tid, base, name)
+        if edge == 'start':
+            open_spans.setdefault(key, []).append(event)
+        elif edge == 'end':
+            starts = open_spans.get(key)
+            start = starts.pop() if starts else None
+            args = {k: v for k, v in event.items() if k not in ('event', 'time', 'project', 'build', 'name')}
+            if base == 'command' and start: name = ' '.join(map(str, start.get('args', [])))[:120] or name
+            if start is None and base == 'build':   # Up-to-date, nothing was started
+                trace.append({'name': f"build: {event.get('status')}", 'ph': 'i', 's': 't',
+                              'pid': pid, 'tid': tid, 'ts': (event['time'] - t0) * 1e6, 'args': args})
+                continue
+            start_time = start['time'] if start else event['time'] - float(event.get('duration') or 0)
+            trace.append(_slice(name if base != 'build' else build, pid, tid, start_time, event['time'], t0, args))
+
+    # Builds that never ended, killed or interrupted, run to the end of the run.
+    for (pid, tid, base, name), starts in open_spans.items():
+        for start in starts:
+            label = start.get('build') if base == 'build' else name
+            trace.append(_slice(str(label), pid, tid, start['time'], end_of_run, t0, {'unfinished': True}))
+
+    for project, (start, end) in project_span.items():
+        trace.append(_slice(project, projects[project], 0, start, end, t0))
+    return trace
+
+
+def write_trace( events_path:Path, trace_path:Path ):
+    """Write the Chrome trace of the run recorded in ``events_path``."""
+    trace = {'traceEvents': trace_events(read_events(events_path)), 'displayTimeUnit': 'ms'}
+    trace_path.write_text(json.dumps(trace), encoding='utf-8')
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""Build watchdog: wall-clock limits per build and per step, and a no-output limit, that stop a hung build."""
+import json
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable
+
+TICK = 1.0   # seconds between checks
+
+
+def build_limits( opts:SimpleNamespace, build:SimpleNamespace, history:dict[str, dict] ) -> SimpleNamespace:
+    """Work out how long a build, each of its steps, and a silence in its output may last.
+
+    A build config can set ``timeout``, ``step_timeouts`` (a dict by step name) and
+    ``idle_timeout`` in seconds. Otherwise the build and each step it has history
+    for may take ``opts.timeout_factor`` times their 95th percentile over recent
+    runs, a build without history gets ``opts.timeout``, and the idle limit is
+    ``opts.idle_timeout``. Zero or None means no limit.
+
+    :return: ``total``, ``steps`` and ``idle`` in seconds.
+    """
+    factor = opts.timeout_factor
+    entry = history.get(build.name, {})
+    p95 = entry.get('duration_p95')
+    total = getattr(build, 'timeout', None) or (p95 * factor if p95 and factor else opts.timeout)
+    steps = {step: seconds * factor for step, seconds in entry.get('subs_p95', {}).items() if seconds and factor}
+    steps |= getattr(build, 'step_timeouts', {})
+    idle = getattr(build, 'idle_timeout', None) or opts.idle_timeout
+    return SimpleNamespace(total=total or None, steps=steps, idle=idle or None)
+
+
+class Watchdog:
+    """
+    Watches a running build script and stops it when a limit from :func:`build_limits` passes.
+
+    The output handlers call :meth:`touch` for every batch, and the steps in progress
+    are followed by reading the ``phase_start``/``phase_end`` events the script appends
+    to its event channel. When a limit passes, :attr:`reason` is set and ``kill`` is
+    called once, the build then fails like any other and is marked "TimedOut".
+
+    :ivar reason: Why the build was stopped, None while it hasn't been.
+    :type reason: str | None
+    """
+    def __init__(self, limits:SimpleNamespace, kill:Callable[[], None], events_path:Path | None = None):
+        self.limits = limits
+        self.reason:str | None = None
+        self._kill = kill
+        self._events_path = events_path
+        self._offset = 0
+        self._steps:dict[str, float] = {}
+        self._start = self._output = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='build-watchdog', daemon=True)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.limits.total or self.limits.idle or self.limits.steps)
+
+    def start(self):
+        self._start = self._output = time.monotonic()
+        if self.active: self._thread.start()
+
+    def touch(self):
+        """Note that the build produced output."""
+        self._output = time.monotonic()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive(): self._thread.join()
+
+    def _follow_steps(self):
+        """Read the events appended since the last check, tracking which steps are running."""
+        if not self._events_path or not self._events_path.exists(): return
+        with open(self._events_path, 'rb') as events_file:
+            events_file.seek(self._offset)
+            data = events_file.read()
+        complete = data[:data.rfind(b'\n') + 1]   # a line being written is read next time
+        self._offset += len(complete)
+        for line in complete.splitlines():
+            try: event = json.loads(line)
+            except json.JSONDecodeError: continue
+            if event.get('event') == 'phase_start':
+                # events carry wall-clock time, the limits are checked on the monotonic clock
+                self._steps[event.get('name')] = time.monotonic() - (time.time() - event.get('time', time.time()))
+            elif event.get('event') == 'phase_end': self._steps.pop(event.get('name'), None)
+
+    def check(self) -> str | None:
+        """The limit that has passed, if any."""
+        now = time.monotonic()
+        limits = self.limits
+        if limits.total and now - self._start > limits.total:
+            return f"ran longer than {limits.total:.0f}s"
+        self._follow_steps()
+        for step, started in self._steps.items():
+            limit = limits.steps.get(step)
+            if limit and now - started > limit:
+                return f"step '{step}' ran longer than {limit:.0f}s"
+        if limits.idle and now - self._output > limits.idle:
+            return f"no output for {limits.idle:.0f}s"
+        return None
+
+    def _run(self):
+        while not self._stop.wait(TICK):
+            if reason := self.check():
+                self.reason = reason
+                self._kill()
+                return
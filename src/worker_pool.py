@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""In-process build runner: execute generated build scripts in warm worker processes."""
+import io
+import os
+import runpy
+import sys
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from pathlib import Path
+from subprocess import CalledProcessError, CompletedProcess
+from typing import Callable
+
+import multiprocessing
+
+from src.resources import TreeSampler
+
+# Imported once by each worker, every build script starts by importing these.
+WORKER_MODULES = ['git', 'rich', 'rich.console', 'rich.panel', 'rich.pretty', 'rich.table',
+                  'src.format', 'src.run', 'src.Timer', 'src.error']
+
+
+# MARK: Worker
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │ __      __       _                                                         │
+# │ \ \    / /__ _ _| |_____ _ _                                               │
+# │  \ \/\/ / _ \ '_| / / -_) '_|                                              │
+# │   \_/\_/\___/_| |_\_\___|_|                                                │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+_channel = None   # the worker's end of the output queue
+
+
+class _LineWriter(io.TextIOBase):
+    """Stands in for stdout/stderr in a worker, sending the complete lines of each write to the parent."""
+    encoding = 'utf-8'
+
+    def __init__(self, job:int, stream:str):
+        super().__init__()
+        self.job, self.stream, self.partial = job, stream, ''
+
+    def writable(self) -> bool: return True
+    def isatty(self) -> bool: return False
+    def reconfigure(self, **kwargs): pass
+
+    def write(self, text:str) -> int:
+        *lines, self.partial = (self.partial + text).split('\n')
+        if lines: _channel.put((self.job, self.stream, [line.rstrip() for line in lines]))
+        return len(text)
+
+    def flush(self):
+        if self.partial:
+            _channel.put((self.job, self.stream, [self.partial.rstrip()]))
+            self.partial = ''
+
+
+def _init_worker(channel, paths:list[str]):
+    """Pay the interpreter startup and the heavy imports once per worker."""
+    global _channel
+    _channel = channel
+    sys.path[:0] = [p for p in paths if p not in sys.path]
+    for name in WORKER_MODULES:
+        try: __import__(name)
+        except ImportError: pass
+
+
+def _run_script(job:int, script_path:str, cwd:str, env:dict) -> int:
+    """Run one build script the way ``python <script>`` would, and report its exit code.
+
+    The working directory, environment, ``sys.path`` and standard streams are
+    restored afterwards so the next build starts from the same state.
+    """
+    _channel.put((job, 'start', os.getpid()))
+    saved = os.getcwd(), dict(os.environ), list(sys.path), list(sys.argv), sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _LineWriter(job, 'stdout'), _LineWriter(job, 'stderr')
+    returncode = 0
+    try:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        sys.argv = [script_path]
+        runpy.run_path(script_path, run_name='__main__')
+    except SystemExit as e:
+        if isinstance(e.code, str):
+            print(e.code, file=sys.stderr)
+            returncode = 1
+        else: returncode = e.code or 0
+    except BaseException:
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        cwd, environ, sys.path[:], sys.argv, sys.stdout, sys.stderr = saved
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+        _channel.put((job, 'exit', returncode))
+    return returncode
+
+
+# MARK: Pool
+# ╭────────────────────────────────────────────────────────────────────────────╮
+# │  ___          _                                                            │
+# │ | _ \___  ___| |                                                           │
+# │ |  _/ _ \/ _ \ |                                                           │
+# │ |_| \___/\___/_|                                                           │
+# ╰────────────────────────────────────────────────────────────────────────────╯
+class ScriptPool:
+    """
+    A pool of worker processes that run generated build scripts in place of ``python <script>``.
+
+    Workers are spawned once, import :data:`WORKER_MODULES`, and then run scripts one
+    after the other. Their output comes back through a queue in batches of lines, and
+    a thread in this process hands each batch to the handlers of the build it belongs
+    to, the same way ``stream_command(..., batch=True)`` does.
+
+    :ivar size: The number of workers, the most builds that run at the same time.
+    :type size: int
+    """
+    def __init__(self, size:int):
+        self.size = max(1, size)
+        context = multiprocessing.get_context('spawn')
+        self._queue = context.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.size, mp_context=context,
+            initializer=_init_worker, initargs=(self._queue, list(sys.path)))
+        self._jobs:dict[int, tuple[Callable, Callable, bool, threading.Event, list, TreeSampler | None]] = {}
+        self._ids = count()
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._dispatch, name='script-pool-output', daemon=True)
+        self._reader.start()
+
+    def _dispatch(self):
+        while (message := self._queue.get()) is not None:
+            job, stream, value = message
+            with self._lock:
+                stdout_handler, stderr_handler, text, done, result, sampler = self._jobs[job]
+            if stream == 'start':   # the worker's pid
+                if sampler: sampler.start(value)
+                continue
+            if stream != 'exit' and not text:
+                value = [line.encode('utf-8', errors='backslashreplace') for line in value]
+            if stream == 'stdout': stdout_handler(value)
+            elif stream == 'stderr': stderr_handler(value)
+            else:
+                result.append(value)
+                done.set()
+
+    def run(self, script_path:Path, *, cwd:Path, env:dict, text:bool=True,
+            stdout_handler:Callable=print, stderr_handler:Callable=print, check:bool=True,
+            sampler:TreeSampler | None = None) -> CompletedProcess:
+        """Run a build script in a worker, with the same contract as :func:`src.run.stream_command`
+        in batch mode, the handlers are given lists of lines. A sampler samples the worker
+        and the commands it starts for as long as the script runs.
+
+        :return: The completed process, with the script's exit code.
+        :raises CalledProcessError: If check is True and the script exits with a non-zero code.
+        """
+        job = next(self._ids)
+        done, result = threading.Event(), []
+        with self._lock:
+            self._jobs[job] = (stdout_handler, stderr_handler, text, done, result, sampler)
+        args = [sys.executable, str(script_path)]
+        try:
+            future = self._executor.submit(_run_script, job, str(script_path), str(cwd), dict(env))
+            future.result()     # raises when the worker died
+            done.wait()         # every line has been handed out once the exit message arrived
+        finally:
+            with self._lock:
+                del self._jobs[job]
+            if sampler: sampler.stop()
+        returncode = result[0]
+        if check and returncode:
+            raise CalledProcessError(returncode, args)
+        return CompletedProcess(args, returncode)
+
+    def shutdown(self):
+        """Stop the workers and the output thread."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._queue.put(None)
+        self._reader.join()
@@ -0,0 +1,72 @@
+"""The produces/consumes edges between builds, shaped like godot and godot-cpp's.
+
+Run from the repository root with ``python -m unittest discover -s test``.
+"""
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from src.scheduler import build_dependencies, consumed_keys, upstream_problem
+
+EDITOR = 'godot.windows.editor.x86_64'
+
+
+def godot_build( source_path:Path, status:str = 'Completed' ) -> SimpleNamespace:
+    return SimpleNamespace(
+        name='w64.msvc.x86_64.windows.editor',
+        verbs=['source', 'build'],
+        source_path=source_path,
+        produces={EDITOR: 'bin/godot.windows.editor*.x86_64*'},
+        stats={'status': status},
+    )
+
+
+def godot_cpp_build( verbs:list[str] ) -> SimpleNamespace:
+    return SimpleNamespace(
+        name='w64.scons.msvc.x86_64.windows.template_debug',
+        verbs=verbs,
+        consumes={'test': [EDITOR]},
+    )
+
+
+class TestDependencies(unittest.TestCase):
+    def setUp(self):
+        self.source_path = Path(tempfile.mkdtemp())
+        self.opts = SimpleNamespace(dry=False, build_actions=['build', 'test'])
+
+    def test_consumer_waits_on_producer(self):
+        builds = [godot_cpp_build(['source', 'build', 'test']), godot_build(self.source_path)]
+        self.assertEqual(build_dependencies(self.opts, builds), [{1}, set()])
+
+    def test_no_edge_without_the_consuming_verb(self):
+        # godot-cpp's configs, while their test verb is disabled
+        builds = [godot_cpp_build(['source', 'build']), godot_build(self.source_path)]
+        self.assertEqual(build_dependencies(self.opts, builds), [set(), set()])
+
+    def test_no_edge_without_the_consuming_action(self):
+        self.opts.build_actions = ['build']
+        self.assertEqual(consumed_keys(self.opts, godot_cpp_build(['source', 'build', 'test'])), [])
+
+    def test_upstream_artifact(self):
+        consumer = godot_cpp_build(['source', 'build', 'test'])
+        producer = godot_build(self.source_path)
+        self.assertEqual(upstream_problem(self.opts, consumer, [producer]), f"artifact '{EDITOR}' is missing")
+
+        (self.source_path / 'bin').mkdir()
+        (self.source_path / 'bin/godot.windows.editor.x86_64.exe').touch()
+        self.assertIsNone(upstream_problem(self.opts, consumer, [producer]))
+
+    def test_upstream_status(self):
+        consumer = godot_cpp_build(['source', 'build', 'test'])
+        (self.source_path / 'bin').mkdir()
+        (self.source_path / 'bin/godot.windows.editor.x86_64.exe').touch()
+
+        failed = godot_build(self.source_path, 'Failed')
+        self.assertIn('Failed', upstream_problem(self.opts, consumer, [failed]))
+        for status in ['Skipped', 'Disabled']:
+            self.assertIsNone(upstream_problem(self.opts, consumer, [godot_build(self.source_path, status)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
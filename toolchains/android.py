@@ -10,11 +10,11 @@ build systems.
 """
 import re
 import subprocess
-from copy import deepcopy
 from types import SimpleNamespace, MethodType
 from typing import cast, Mapping, Any
 
 from share.script_preamble import *
+from src.layer import ConfigLayer
 
 
 def strip_until_installed_packages(list_installed_raw) -> str:
@@ -161,7 +161,7 @@ def expand(self, config:SimpleNamespace) -> list:
     """
     configs_out:list = []
     for abi in self.abi:
-        cfg = deepcopy(config)
+        cfg = ConfigLayer(config)
         setattr( cfg, 'android_abi', abi )
         setattr( cfg, 'arch', abi )
         setattr( cfg, 'platform', 'android' )
@@ -11,14 +11,16 @@ building and compiling code for different platforms and architectures.
 """
 import itertools
 import platform
+import re
 import shlex
 import subprocess
-from copy import deepcopy
 from types import SimpleNamespace, MethodType
+from typing import Callable
 
 import toolchains.android as android
 from share.script_preamble import *
 from src.config import toolchain_base, gopts
+from src.layer import ConfigLayer
 
 """Expand config for toolchain arch/platform cartesian product.
 
@@ -39,14 +41,14 @@ def generic_toolchain_expand( self:SimpleNamespace, build:SimpleNamespace ) -> l
     configs_out:list = []
 
     for target_arch, target_platform in itertools.product(self.arch_list, self.platform_list):
-        tc = deepcopy(self)
+        tc = ConfigLayer(self)
         setattr(tc, 'host_arch', platform.machine() )
         setattr(tc, 'target_platform', target_platform )
         setattr(tc, 'target_arch', target_arch )
 
-        build = deepcopy(build)
-        setattr(build, 'toolchain', tc )
-        configs_out.append( build )
+        cfg = ConfigLayer(build)
+        setattr(cfg, 'toolchain', tc )
+        configs_out.append( cfg )
 
     return configs_out
 
@@ -59,7 +61,7 @@ def generic_toolchain_expand( self:SimpleNamespace, build:SimpleNamespace ) -> l
 # │            ██ ███ ██ ██ ██  ██ ██ ██   ██ ██    ██ ██ ███ ██      ██       │
 # │             ███ ███  ██ ██   ████ ██████   ██████   ███ ███  ███████       │
 # ╰────────────────────────────────────────────────────────────────────────────╯
-windows_toolchains:list = []
+windows_toolchains:dict[str, Callable[[], SimpleNamespace]] = {}
 # The variations of toolchains for mingw are listed here: https://www.mingw-w64.org/downloads/
 
 # MARK: MSVC
@@ -97,7 +99,7 @@ def msvc_toolchain() -> SimpleNamespace:
     return toolchain
 
 if sys.platform == "win32":
-    windows_toolchains.append( msvc_toolchain() )
+    windows_toolchains['msvc'] = msvc_toolchain
 
 # MARK: LLVM
 # ╭────────────────────────╮
@@ -155,7 +157,7 @@ def llvm_toolchain() -> SimpleNamespace:
     setattr( toolchain, 'configure', MethodType(configure_llvm, toolchain ) )
     return toolchain
 
-windows_toolchains.append( llvm_toolchain() )
+windows_toolchains['llvm'] = llvm_toolchain
 
 # MARK: LLVM-MinGW
 # ╭───────────────────────────────────────────────────────╮
@@ -213,7 +215,7 @@ def llvm_mingw_toolchain() -> SimpleNamespace:
     setattr( toolchain, 'configure', MethodType(configure_llvm_mingw, toolchain ) )
     return toolchain
 
-windows_toolchains.append( llvm_mingw_toolchain())
+windows_toolchains['llvm-mingw'] = llvm_mingw_toolchain
 
 # MARK: MinGW64
 # ╭──────────────────────────────────────╮
@@ -257,7 +259,7 @@ def mingw64_toolchain() -> SimpleNamespace:
     return toolchain
 
 
-windows_toolchains.append( mingw64_toolchain())
+windows_toolchains['mingw64'] = mingw64_toolchain
 
 
 
@@ -288,7 +290,7 @@ def msys2_mingw32_toolchain() -> SimpleNamespace:
     setattr( toolchain, 'expand', MethodType(generic_toolchain_expand, toolchain ) )
     return toolchain
 
-windows_toolchains.append( msys2_mingw32_toolchain() )
+windows_toolchains['msys2-mingw32'] = msys2_mingw32_toolchain
 
 
 def msys2_mingw64_toolchain() -> SimpleNamespace:
@@ -305,7 +307,7 @@ def msys2_mingw64_toolchain() -> SimpleNamespace:
     }})
     setattr( toolchain, 'expand', MethodType(generic_toolchain_expand, toolchain ) )
     return toolchain
-windows_toolchains.append( msys2_mingw64_toolchain() )
+windows_toolchains['msys2-mingw64'] = msys2_mingw64_toolchain
 
 def msys2_ucrt64_toolchain() -> SimpleNamespace:
     """
@@ -321,7 +323,7 @@ def msys2_ucrt64_toolchain() -> SimpleNamespace:
     }})
     setattr( toolchain, 'expand', MethodType(generic_toolchain_expand, toolchain ) )
     return toolchain
-windows_toolchains.append( msys2_ucrt64_toolchain() )
+windows_toolchains['msys2-ucrt64'] = msys2_ucrt64_toolchain
 
 def msys2_clang64_toolchain() -> SimpleNamespace:
     """
@@ -337,7 +339,7 @@ def msys2_clang64_toolchain() -> SimpleNamespace:
     }})
     setattr( toolchain, 'expand', MethodType(generic_toolchain_expand, toolchain ) )
     return toolchain
-windows_toolchains.append( msys2_clang64_toolchain() )
+windows_toolchains['msys2-clang64'] = msys2_clang64_toolchain
 
 # MARK: Android
 # ╭──────────────────────────────────╮
@@ -349,7 +351,7 @@ windows_toolchains.append( msys2_clang64_toolchain() )
 # The variations of toolchains for mingw are listed here: https://www.mingw-w64.org/downloads/
 android_toolchain:SimpleNamespace | None = android.android_toolchain()
 if android_toolchain is SimpleNamespace:
-    windows_toolchains.append( android_toolchain )
+    windows_toolchains['android'] = lambda: android_toolchain
 
 # MARK: Emscripten
 # ╭────────────────────────────────────────────╮
@@ -451,7 +453,7 @@ def win32_emscripten_toolchain() -> SimpleNamespace:
     setattr( toolchain, 'update', MethodType(emscripten_update, toolchain) )
     return toolchain
 
-windows_toolchains.append( win32_emscripten_toolchain() )
+windows_toolchains['emscripten'] = win32_emscripten_toolchain
 
 # MARK: Darwin
 # ╭────────────────────────────────────────────────────────────────────────────╮
@@ -461,7 +463,7 @@ windows_toolchains.append( win32_emscripten_toolchain() )
 # │                 ██   ██ ██   ██ ██   ██ ██ ███ ██ ██ ██  ██ ██             │
 # │                 ██████  ██   ██ ██   ██  ███ ███  ██ ██   ████             │
 # ╰────────────────────────────────────────────────────────────────────────────╯
-darwin_toolchains:list = []
+darwin_toolchains:dict[str, Callable[[], SimpleNamespace]] = {}
 
 # MARK: AppleClang
 # ╭───────────────────────────────────────────────╮
@@ -487,7 +489,7 @@ def appleclang_toolchain() -> SimpleNamespace:
     setattr( toolchain, 'expand', MethodType(generic_toolchain_expand, toolchain ) )
     return toolchain
 
-darwin_toolchains.append( appleclang_toolchain() )
+darwin_toolchains['appleclang'] = appleclang_toolchain
 
 # MARK: Emscripten
 # ╭────────────────────────────────────────────╮
@@ -573,7 +575,7 @@ def darwin_emscripten_toolchain() -> SimpleNamespace:
     setattr( toolchain, 'expand', MethodType(generic_toolchain_expand, toolchain ) )
     return toolchain
 
-darwin_toolchains.append( darwin_emscripten_toolchain() )
+darwin_toolchains['emscripten'] = darwin_emscripten_toolchain
 
 # MARK: Select
 # ╭────────────────────────────────────────────────────────────────────────────╮
@@ -588,6 +590,9 @@ darwin_toolchains.append( darwin_emscripten_toolchain() )
 def generate(opts:SimpleNamespace) -> dict:
     """Generate a dictionary of available toolchains for the current platform.
 
+    Only toolchains matching ``--toolchain-regex`` are created, so the probing some
+    of them do, like msvc running vswhere, is skipped for the ones filtered out.
+
     Args:
         opts (SimpleNamespace): Configuration options including the platform.
 
@@ -596,14 +601,18 @@ def generate(opts:SimpleNamespace) -> dict:
     """
     import sys
 
-    toolchains:dict = {}
+    factories:dict = {}
 
     match sys.platform:
         case 'win32':
-            for tc in windows_toolchains:
-                toolchains[tc.name] = tc
+            factories = windows_toolchains
         case 'darwin':
-            for tc in darwin_toolchains:
-                toolchains[tc.name] = tc
+            factories = darwin_toolchains
+
+    toolchains:dict = {}
+    for name, factory in factories.items():
+        if not re.search(opts.toolchain_regex, name): continue
+        tc = factory()
+        if tc is not None: toolchains[tc.name] = tc
 
     return toolchains
\ No newline at end of file